@@ -5,19 +5,40 @@ Created on Tue Aug 14 08:36:12 2018
 @author: Nicolaj Baramsky
 """
 import os
+import re
+import sys
 import datetime
 import pandas as pd
 import configparser
 import numpy as np
+import matplotlib
+matplotlib.use('Agg') # charts are only saved to file, also from the html refresh thread
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.collections import LineCollection
 import numbers
 from pathlib import Path
-import re
-import shutil
+import tempfile
+import hashlib
 import time
-import datetime
-def main():
+import io
+import json
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import OrderedDict, namedtuple
+from PIL import Image
+from category_matcher import CategoryMatcher
+from title_index import aggregate_titles, app_name, normalize_title
+from summary_store import SummaryStore
+import binlog
+import archive
+from event_writer import log_in_use
+
+def main(argv=()):
+    # python analytics.py --summarize [start [end [freq]]]
+    if argv and argv[0] == '--summarize':
+        Analytics().print_summary(*argv[1:4])
+        return
     reanalyze_all()
 
 def sec2str(dur):
@@ -32,30 +53,125 @@ def Sec2hms(seconds):
     sec = int(seconds%60)
     return hr, min, sec
 
-def reanalyze_all():
-    logfiles = os.listdir('data')
-    for logfile in logfiles:
+def utc_offset(timestamp):
+    # seconds between local time and utc at the given epoch time
+    local = datetime.datetime.fromtimestamp(float(timestamp))
+    utc = datetime.datetime.fromtimestamp(float(timestamp), datetime.timezone.utc)
+    return (local - utc.replace(tzinfo=None)).total_seconds()
+
+def reanalyze_all(workers=None):
+    # reclassify and redraw every day in a process pool, the html index is
+    # written once at the end
+    # days converted by binlog.py or archived by archive.py may no longer have their csv
+    logfiles = sorted(set(log for log in os.listdir('data') if Path(log).suffix == '.csv')
+                      | set(binlog.list_days('data')) | set(archive.list_days('data')))
+    if not logfiles:
+        print('no logs found in data')
+        return
+    start = time.perf_counter()
+    stage_times = {}
+    # the workers must not write the same archive at once, its days are
+    # reclassified here in one go and skipped by redo_cat in the workers
+    redo_start = time.perf_counter()
+    analytic = Analytics()
+    for path in archive.list_archives('data'):
+        days = archive.read_index(path)
+        if days:
+            analytic.redo_cat(min(days))
+    stage_times['redo_cat archives'] = time.perf_counter() - redo_start
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(_reanalyze_day, logfile): logfile for logfile in logfiles}
+        for done, future in enumerate(as_completed(futures), 1):
+            output, times = future.result()
+            print(output, end='')
+            print('[{}/{}] {} reanalyzed'.format(done, len(logfiles), futures[future]))
+            for stage, seconds in times.items():
+                stage_times[stage] = stage_times.get(stage, 0) + seconds
+
+    html_start = time.perf_counter()
+    Analytics().create_html(logfiles[-1])
+    stage_times['create_html'] = time.perf_counter() - html_start
+
+    print('reanalyzed {} logs in {:.1f} s'.format(len(logfiles), time.perf_counter() - start))
+    for stage, seconds in stage_times.items():
+        print('{0: 10.2f} s  {1}'.format(seconds, stage))
+
+_worker_analytics = None
+
+def _init_worker():
+    # every worker process loads the config once
+    global _worker_analytics
+    _worker_analytics = Analytics()
+
+def _reanalyze_day(logfile):
+    # runs in a worker process, returns the printed text and the time per stage
+    analytic = _worker_analytics
+    times = {}
+    output = io.StringIO()
+    with redirect_stdout(output):
         print('logfile', logfile)
-        #logfile = '' #'2018-9-5.csv'
-        analytic = Analytics()
-        analytic.redo_cat(logfile)
-        analytic.print_review(logfile)
-        analytic.print_timeline(logfile)
-        analytic.print_pi_chart(logfile)
-        analytic.create_html(logfile)
+        for stage in [analytic.redo_cat, analytic.print_review, analytic.print_timeline, analytic.print_pi_chart]:
+            stage_start = time.perf_counter()
+            stage(logfile)
+            times[stage.__name__] = time.perf_counter() - stage_start
+    return output.getvalue(), times
+
+
+# parsed and compiled config.dat, shared by all Analytics of a process
+CompiledConfig = namedtuple('CompiledConfig', ['config', 'string_cats', 'color_list', 'proj_list',
+                                               'matcher', 'version', 'digest'])
+_config_cache = {} # path -> ((mtime, size), sha1 of the file, CompiledConfig)
+
+# png text chunk with the digest of the inputs a chart was drawn from
+CHART_DIGEST_KEY = 'chart digest'
 
 
 class Analytics():
 
     def __init__(self):
         self.path_data = 'data'
-        self.config = self._load_config()
-        self.string_cats = self.config.items('CATEGORIES')
-        self.color_list = self.config.items('COLORS')
-        self.proj_list = self.config.items('PROJECTS')
+        self.path_config = 'config.dat'
+        self.config_digest = None
+        self.config_error = None # message of the last config.dat that did not load
+        self.reload_config()
+        self.summary = SummaryStore(self.path_data + '/summary.sqlite')
+        self.live = None # DayAggregate of the day script.py is recording
+        self._frames = OrderedDict() # path -> ((mtime, size), parsed log)
+        self.frame_cache_size = 8
+        self.parse_count = 0
+        self._chart_digests = {} # png path -> (mtime, digest of its inputs)
+        self.chart_hits = 0
+        self.chart_misses = 0
+        self.chart_seconds = 0.0
+
+    def reload_config(self):
+        # cheap when config.dat is unchanged, returns True if it was reloaded.
+        # A broken config.dat (e.g. half saved by the editor) keeps the rules
+        # loaded before it, there are none on the first load.
+        try:
+            compiled = self._load_config()
+        except (configparser.Error, re.error, OSError, UnicodeError) as e:
+            if self.config_digest is None:
+                raise
+            if str(e) != self.config_error:
+                print('config.dat not reloaded, the previous config is kept:', e)
+                self.config_error = str(e)
+            return False
+        self.config_error = None
+        if compiled.digest == self.config_digest:
+            return False
+        self.config = compiled.config
+        self.string_cats = compiled.string_cats
+        self.color_list = compiled.color_list
+        self.proj_list = compiled.proj_list
+        self.matcher = compiled.matcher
+        # logs classified with the same rules don't need redo_cat again
+        self.config_version = compiled.version
+        self.config_digest = compiled.digest
+        return True
 
     def _load_config(self):
-        path_config = 'config.dat'
+        path_config = self.path_config
         if not os.path.isfile(path_config):
             with open(path_config, 'w', encoding='utf-8') as file:
                 config_template="""[SETTINGS]
@@ -91,9 +207,23 @@ test:
                 file.write(config_template)
         if not os.path.isdir('figs'):
             os.mkdir('figs')
-        
+
+        stat = os.stat(path_config)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = _config_cache.get(path_config)
+        if cached is not None and cached[0] == stamp:
+            return cached[2]
+        with open(path_config, 'rb') as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        if cached is not None and cached[1] == digest:
+            # touched but not changed
+            _config_cache[path_config] = (stamp, digest, cached[2])
+            return cached[2]
+        text = raw.decode('utf-8', errors='replace')
+
         config = configparser.ConfigParser()
-        config.read(path_config)
+        config.read_string(text)
         
         # Add settings section if it doesn't exist
         if not config.has_section('SETTINGS'):
@@ -102,38 +232,106 @@ test:
             config.set('SETTINGS', 'md_folder', 'C:/Users/YourUser/Documents/Notes')
             with open(path_config, 'w') as configfile:
                 config.write(configfile)
+            stat = os.stat(path_config)
+            stamp = (stat.st_mtime_ns, stat.st_size)
 
         # custom logic to handle duplicates in CATEGORIES
         categories = []
-        with open(path_config, 'r', encoding='utf-8') as f:
-            in_categories_section = False
-            for line in f:
-                line = line.strip()
-                if line == '[CATEGORIES]':
-                    in_categories_section = True
-                    continue
-                elif line.startswith('['):
-                    in_categories_section = False
-                    continue
-                
-                if in_categories_section and ':' in line:
-                    key, value = line.split(':', 1)
-                    key = key.strip()
-                    if key not in [k for k, v in categories]:
-                        categories.append((key, value.strip()))
+        seen = set()
+        in_categories_section = False
+        for line in text.splitlines():
+            line = line.strip()
+            if line == '[CATEGORIES]':
+                in_categories_section = True
+                continue
+            elif line.startswith('['):
+                in_categories_section = False
+                continue
+            
+            if in_categories_section and ':' in line:
+                key, value = line.split(':', 1)
+                key = key.strip()
+                if key not in seen:
+                    seen.add(key)
+                    categories.append((key, value.strip()))
         
         config['CATEGORIES'] = {}
         for key, value in categories:
             config['CATEGORIES'][key] = value
-            
-        return config
 
+        string_cats = config.items('CATEGORIES')
+        # 'pattern: project', a pattern without a project name is its own name
+        proj_list = []
+        if config.has_section('PROJECTS'):
+            proj_list = [(pattern, project or pattern) for pattern, project in config.items('PROJECTS')]
+        compiled = CompiledConfig(config, string_cats, config.items('COLORS'), proj_list,
+                                  self._build_matcher(string_cats, proj_list),
+                                  hashlib.sha1(repr((string_cats, proj_list)).encode('utf-8')).hexdigest()[:16],
+                                  digest)
+        _config_cache[path_config] = (stamp, digest, compiled)
+        return compiled
+
+    def _build_matcher(self, string_cats, proj_list=()):
+        # titles that match no rule fall back to the category of the last rule,
+        # this is what the old per-rule loop in get_cat returned. Titles without
+        # a project get ''
+        default = 'not categorized'
+        if string_cats:
+            default = string_cats[-1][1]
+        return CategoryMatcher(string_cats, default=default, projects=proj_list)
+
+
+    def _log_source(self, path):
+        # the binary copy from binlog.py stands in for the csv while it is not
+        # older, days of finished months may only be in their monthly archive
+        source = binlog.newer_binary(path)
+        if source is None and os.path.isfile(path):
+            source = path
+        if source is None:
+            source = archive.find_day(path)
+        return source
+
+    def _log_exists(self, path):
+        return self._log_source(path) is not None
+
+    def _log_stat(self, path):
+        return os.stat(self._log_source(path) or path)
+
+    def _read_log(self, path):
+        # parsed logs are shared by all methods until the file changes on disk
+        source = self._log_source(path) or path
+        stat = os.stat(source)
+        key = (source, stat.st_mtime_ns, stat.st_size)
+        cached = self._frames.get(path)
+        if cached is not None and cached[0] == key:
+            self._frames.move_to_end(path)
+            return cached[1]
+
+        if source == path:
+            df = binlog.read_csv(path)
+        elif source.endswith('.rec'):
+            df = binlog.read_day(path)
+        else:
+            df = archive.read_day(source, os.path.basename(path))
+        self.parse_count += 1
+        self._frames[path] = (key, df)
+        while len(self._frames) > self.frame_cache_size:
+            self._frames.popitem(last=False)
+        return df
+
+    def _live_for(self, path):
+        # the running aggregate if it covers this log
+        if self.live is not None and os.path.basename(path) == self.live.logfile():
+            return self.live
+        return None
+
+    def _log_path(self, logfile=''):
+        if logfile == '':
+            today = datetime.datetime.now()
+            logfile = '{0:d}-{1:02d}-{2:02d}.csv'.format(today.year, today.month, today.day)
+        return self.path_data + '/' + logfile
 
     def print_timeline(self, logfile=''):
-        # check the filename does not contain "mod.log" to avoid crash
-        if "mod.log" in logfile:
-            return
-
         if logfile == '':
             today = datetime.datetime.now()
             filename = '{0:d}-{1:02d}-{2:02d}.csv'.format(today.year, today.month, today.day)
@@ -143,32 +341,66 @@ test:
             filename = logfile
             today = datetime.datetime.strptime(logfile[:10], '%Y-%m-%d')
         path = self.path_data + '/' + filename
-        if not os.path.isfile(path):
+        if not self._log_exists(path):
                 # print out an error message if the file is not found
                 print(f'{path} Logfile {logfile} not found (print_timeline). Start script.py first to generate data')
                 # raise FileNotFoundError(f'{path} Logfile {logfile} not found (print_timeline). Start script.py first to generate data')
                 return
 
-        df = pd.read_csv(path, encoding="ISO-8859-1", names=['time', 'category', 'duration', 'title', 'timestamp'], sep=',')
+        live = self._live_for(path)
+        if live is not None:
+            df = live.frame()
+        else:
+            df = self._read_log(path)
         u_cats = self.get_unique_categories(self.string_cats) # unique category name
 
         colors = self.get_colors(logfile)
-        plt.title('')
         start_time = ''
+        # convert epoch seconds to matplotlib date numbers in local time in one go
+        epoch_time = pd.to_numeric(df.time, errors='coerce').values
+        duration = pd.to_numeric(df.duration, errors='coerce').values
+        in_cats = df.category.isin(u_cats).values & ~np.isnan(epoch_time)
+        if in_cats.any():
+            start_time = datetime.datetime.fromtimestamp(float(epoch_time[in_cats][0])).date()
+            offsets = [utc_offset(epoch_time[in_cats][0]), utc_offset(epoch_time[in_cats][-1])]
+            if offsets[0] != offsets[1]:
+                # daylight saving switch during this day, convert row by row
+                offsets = np.array([utc_offset(t) if not np.isnan(t) else 0 for t in epoch_time])
+            else:
+                offsets = offsets[0]
+            epoch = mdates.date2num(datetime.datetime(1970, 1, 1))
+            end = epoch + (epoch_time + offsets) / 86400
+            start = end - duration / 86400
+
+        # one collection per category instead of one Line2D per event
+        collections = []
         for idx, u_cat in enumerate(u_cats):
-            temp = df.loc[df.category == u_cat]
-            time = temp.time.values
-            duration = temp.duration.values
+            mask = (df.category == u_cat).values & ~np.isnan(epoch_time)
+            if not mask.any():
+                continue
+            segments = np.empty((mask.sum(), 2, 2))
+            segments[:, 0, 0] = start[mask]
+            segments[:, 1, 0] = end[mask]
+            segments[:, :, 1] = idx
+            collections.append((segments, colors[idx]))
 
-            for entry in range(len(time)):
-                start_time = datetime.datetime.fromtimestamp(float(time[0])).date()
-                start = datetime.datetime.fromtimestamp(float(time[entry]) - float(duration[entry]))
-                end = datetime.datetime.fromtimestamp(float(time[entry]))
-                #print(u_cat, start, end, '\t', duration[entry])
-                plt.plot([start , end], [idx, idx] , '-.', linewidth=7, color=colors[idx])
+        filename = '{0:d}-{1:02d}-{2:02d}.png'.format(today.year, today.month, today.day)
+        path = 'figs/timeline/' + filename
+        digest = None
+        if(start_time != ''):
+            digest = self._chart_digest('timeline', start_time, collections)
+            if self._chart_is_current(path, digest):
+                return
+        render_start = time.perf_counter()
+        plt.title('')
+        ax = plt.gca()
+        for segments, color in collections:
+            ax.add_collection(LineCollection(segments, linestyles='-.', linewidths=7, colors=color))
 
         if(start_time != ''):
-           # plt.yticks(range(len(u_cat)+1), u_cats.append('test'),[])
+            ax.autoscale_view()
+            ax.xaxis_date()
+            # plt.yticks(range(len(u_cat)+1), u_cats.append('test'),[])
             plt.grid()
             plt.title(start_time)
             start_time = datetime.datetime.combine(start_time, datetime.time(0,1))
@@ -181,21 +413,14 @@ test:
             plt.gca().xaxis.set_major_formatter(myFmt)
             plt.tight_layout()
 
-            filename = '{0:d}-{1:02d}-{2:02d}.png'.format(today.year, today.month, today.day)
             #fig_path = str(today.year) + '-' + str(today.month) + '-' + str(today.day) + '.png'
-
-            path = 'figs/timeline/' + filename
-            plt.savefig(path)
+            self._save_chart(path, digest, render_start)
 
             plt.close()
             print('Timeline saved as {}'.format(path))
 
 
     def analyze(self, logfile=''):
-        # check the filename does not contain "mod.log" to avoid crash
-        if "mod.log" in logfile:
-            return
-
         u_cats=[]
         u_dur=[]
         date=[]
@@ -208,13 +433,18 @@ test:
         else:
             filename = logfile
         path = self.path_data + '/' + filename
-        if not os.path.isfile(path):
+        if not self._log_exists(path):
             return u_cats, u_dur, date, df
 
         date = datetime.datetime.strptime(filename[0:10], '%Y-%m-%d')
 
-        df = pd.read_csv(path, encoding = "ISO-8859-1", names=['time', 'category', 'duration', 'title'], usecols=[0,1,2,3])
         u_cats = self.get_unique_categories(self.string_cats) # unique category name
+        live = self._live_for(path)
+        if live is not None:
+            totals = live.get_totals()
+            return u_cats, [totals.get(u_cat, 0) for u_cat in u_cats], date, live.frame()
+
+        df = self._read_log(path)
         u_dur = [] # duratio of unice category
         for u_cat in u_cats:
             temp = df.loc[df.category == u_cat]
@@ -222,13 +452,23 @@ test:
             u_dur.append(dur)
         return u_cats, u_dur, date, df
 
+    def analyze_projects(self, logfile=''):
+        # seconds per project of the config, from the same parsed log as analyze
+        u_projs = self.get_unique_projects()
+        path = self._log_path(logfile)
+        if not u_projs or not self._log_exists(path):
+            return u_projs, [0] * len(u_projs)
+        live = self._live_for(path)
+        if live is not None:
+            totals = live.get_projects()
+        else:
+            df = self._read_log(path)
+            totals = self._project_durations(df, pd.to_numeric(df.duration, errors='coerce').fillna(0))
+        return u_projs, [totals.get(u_proj, 0) for u_proj in u_projs]
 
 
-    def print_pi_chart(self, logfile=''):
-        # check the filename does not contain "mod.log" to avoid crash
-        if "mod.log" in logfile:
-            return
 
+    def print_pi_chart(self, logfile=''):
         if logfile == '':
             today = datetime.datetime.today()
         else:
@@ -242,72 +482,193 @@ test:
         total_sec = int(total_dur%60)
         if (total_dur > 0):
             weekday_name = today.strftime('%a')
+            title = f'{weekday_name}, {today.month:02}.{today.day:02}.{today.year:04} - {total_hr:02}:{total_min:02}:{total_sec:02} h'
+            colors = self.get_colors(logfile)
+            path = 'figs/pie/'+filename
+            digest = self._chart_digest('pie', title, u_cats, [float(dur) for dur in u_dur], colors)
+            if self._chart_is_current(path, digest):
+                return
+            render_start = time.perf_counter()
             plt.figure(num=None, figsize=(8, 6), dpi=80, facecolor='w', edgecolor='k')
-            plt.title(f'{weekday_name}, {today.month:02}.{today.day:02}.{today.year:04} - {total_hr:02}:{total_min:02}:{total_sec:02} h')
+            plt.title(title)
 
             for t in range(len(u_cats)):
                 hr,mn,sec = Sec2hms(u_dur[t])
                 u_cats[t] = u_cats[t] + "-" + '{0:02}:{1:02}:{2:02}'.format(hr,mn,sec)
 
-            plt.pie(u_dur, labels=u_cats,  autopct='%1.1f%%', colors = self.get_colors(logfile))
+            plt.pie(u_dur, labels=u_cats,  autopct='%1.1f%%', colors = colors)
             plt.axis('equal')
             plt.tight_layout()
-            path = 'figs/pie/'+filename
-            plt.savefig(path)
+            self._save_chart(path, digest, render_start)
             #plt.show()
             plt.close()
 
             print('Pie chart saved as {}'.format(path))
 
 
+    def _chart_digest(self, *inputs):
+        # hash of everything a chart is drawn from, numpy arrays by their content
+        digest = hashlib.sha1()
+        for value in inputs:
+            if isinstance(value, (list, tuple)):
+                digest.update(self._chart_digest(*value).encode('ascii'))
+            elif isinstance(value, np.ndarray):
+                digest.update(str(value.shape).encode('ascii'))
+                digest.update(np.ascontiguousarray(value).tobytes())
+            else:
+                digest.update(repr(value).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _chart_is_current(self, path, digest):
+        # the digest of the inputs is stored in the png, a chart drawn from the
+        # same inputs is not drawn again
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self.chart_misses += 1
+            return False
+        cached = self._chart_digests.get(path)
+        if cached is None or cached[0] != mtime:
+            try:
+                with Image.open(path) as image:
+                    cached = (mtime, image.text.get(CHART_DIGEST_KEY))
+            except (OSError, AttributeError, SyntaxError):
+                cached = (mtime, None)
+            self._chart_digests[path] = cached
+        if cached[1] == digest:
+            self.chart_hits += 1
+            return True
+        self.chart_misses += 1
+        return False
+
+    def _save_chart(self, path, digest, render_start):
+        plt.savefig(path, metadata={CHART_DIGEST_KEY: digest})
+        self.chart_seconds += time.perf_counter() - render_start
+        if digest is not None:
+            self._chart_digests[path] = (os.stat(path).st_mtime_ns, digest)
+
+    def chart_stats(self):
+        # charts skipped and drawn, and the matplotlib time the skipped ones saved
+        per_chart = self.chart_seconds / self.chart_misses if self.chart_misses else 0.0
+        return {'hits': self.chart_hits, 'misses': self.chart_misses,
+                'render_seconds': self.chart_seconds, 'saved_seconds': self.chart_hits * per_chart}
+
     def get_colors(self, logfile):
         colors = []
-        u_cats, _, _, _ = self.analyze(logfile)
+        # the categories only depend on the config, no need to parse the log
+        u_cats = []
+        if self._log_exists(self._log_path(logfile)):
+            u_cats = self.get_unique_categories(self.string_cats)
         for u_cat in u_cats:
             for col_cat, col in self.color_list:
                 if u_cat == col_cat:
                     colors.append(col)
         return colors
 
-    def redo_cat(self, logfile=''):
-        if "mod.log" in logfile:
-            return
+    def redo_cat(self, logfile='', dry_run=False):
+        # reclassify a log with the current config. The rows are streamed into a
+        # temp file next to the log which then replaces it in one step. Logs
+        # already classified with this config version are skipped, dry_run only
+        # prints the rows that would change.
         path = self.path_data + '/' + logfile
         if not os.path.isfile(path):
-                raise FileNotFoundError (path+' Logfile not found (redo_cat). Start script.py first do generate data')
-        outlog = ""
-        mylog = ""
+            if self._log_exists(path):
+                return self._redo_binary(logfile, dry_run)
+            raise FileNotFoundError (path+' Logfile not found (redo_cat). Start script.py first do generate data')
+        stat = os.stat(path)
+        if not dry_run and self.summary.classified(logfile) == (self.config_version, stat.st_size, stat.st_mtime_ns):
+            return 0
+        # the recorder keeps appending to the log it has open, rows written
+        # after the replace would go to the old file
+        if not dry_run and log_in_use(path):
+            print('{} is still recorded by script.py, not reclassified'.format(logfile))
+            return 0
+
+        changed = 0
+        outlog = None
+        if not dry_run:
+            fd, tmp_path = tempfile.mkstemp(prefix='.' + logfile + '.', suffix='.tmp', dir=self.path_data)
+            outlog = os.fdopen(fd, 'w', encoding='utf-8')
         try:
-            mylog = open(path, "r", encoding='utf-8',errors='ignore')
-            outlog = open(self.path_data + '/' +"mod.log", "w", encoding='utf-8')
-            time_str=''
-            for line in mylog:
-                words =[]
-                words = line.rstrip().split(',')
-                if (len(words) >3):
-                    words[1] = self.get_cat(words[3])
-                    if len(words[-1]) != 5 or not ':' in words[-1]:
-                        local_t = time.localtime(float(words[0]))
-                        time_str ="{0:02}:{1:02}".format(local_t.tm_hour,local_t.tm_min)
-                        words.append(time_str)
-
-                line = ",".join(words)
-                outlog.write(line+"\n")
-                line=[]
-
-            mylog.close()
-            outlog.close()
+            with open(path, "r", encoding='utf-8',errors='ignore') as mylog:
+                for line in mylog:
+                    line = line.rstrip()
+                    new_line = self._redo_line(line)
+                    if new_line != line:
+                        changed += 1
+                        if dry_run:
+                            print('- ' + line)
+                            print('+ ' + new_line)
+                    if outlog is not None:
+                        outlog.write(new_line+"\n")
+            if outlog is not None:
+                outlog.close()
+                if changed:
+                    os.replace(tmp_path, path)
+        except PermissionError:
+            # windows, script.py opened the log in the meantime
+            print('{} is still recorded by script.py, not reclassified'.format(logfile))
+            return 0
         except (RuntimeError, TypeError, NameError):
-            return
-        if os.path.isfile(outlog.name) and os.path.isfile(mylog.name):
-            shutil.move(outlog.name,mylog.name)
+            return changed
+        finally:
+            if outlog is not None:
+                outlog.close()
+                if os.path.isfile(tmp_path):
+                    os.remove(tmp_path)
+
+        if dry_run:
+            print('{} of {} rows would change'.format(changed, logfile))
+        else:
+            stat = os.stat(path)
+            self.summary.set_classified(logfile, self.config_version, stat.st_size, stat.st_mtime_ns)
+        return changed
+
+    def _redo_binary(self, logfile, dry_run=False):
+        # a day that is only kept in binary or in a monthly archive, every
+        # distinct title is classified once and the rows get the ids of the new
+        # category and project. All days of an archive are done together, it
+        # is only written once.
+        path = self.path_data + '/' + logfile
+        source = self._log_source(path)
+        stat = os.stat(source)
+        if not dry_run and self.summary.classified(logfile) == (self.config_version, stat.st_size, stat.st_mtime_ns):
+            return 0
+        classify = lambda title: (self.get_cat(title), self.get_project(title))
+        if source.endswith('.rec'):
+            changes = {logfile: binlog.reclassify(path, classify, dry_run)}
+        else:
+            changes = archive.reclassify(source, classify, dry_run)
+        if dry_run:
+            # the archive is reclassified as a whole, only the asked day is shown
+            day_changes = changes.get(logfile, [])
+            for title, old_cat, new_cat, old_proj, new_proj, rows in day_changes:
+                print('- {} rows {},{} {}'.format(rows, old_cat, old_proj, title))
+                print('+ {} rows {},{} {}'.format(rows, new_cat, new_proj, title))
+            print('{} of {} rows would change'.format(sum(change[-1] for change in day_changes), logfile))
+        else:
+            stat = os.stat(source)
+            for day in changes:
+                self.summary.set_classified(day, self.config_version, stat.st_size, stat.st_mtime_ns)
+        return sum(change[-1] for change in changes.get(logfile, []))
+
+    def _redo_line(self, line):
+        # time,category,duration,title,hh:mm[,project]
+        words = line.split(',')
+        if (len(words) >3):
+            words[1] = self.get_cat(words[3])
+            if len(words) < 5 or len(words[4]) != 5 or not ':' in words[4]:
+                local_t = time.localtime(float(words[0]))
+                time_str ="{0:02}:{1:02}".format(local_t.tm_hour,local_t.tm_min)
+                words.insert(4, time_str)
+            project = self.get_project(words[3])
+            words = words[:5]
+            if project:
+                words.append(project)
+        return ",".join(words)
 
     def print_review(self, logfile=''):
 
-        # check the filename does not contain "mod.log" to avoid crash
-        if "mod.log" in logfile:
-            return
-
         u_cats, u_dur, date, df = self.analyze(logfile)
         print('')
         print('')
@@ -338,13 +699,28 @@ test:
         sum_dur_sec = sum_cat_time%60
         print('-------------------------------------')
         print('{0: 6}:{1:02}:{2:02} h not categorized'.format(sum_dur_hr, sum_dur_min, sum_dur_sec))
+        # where the not categorized time went, from the title index
+        day = '{:%Y-%m-%d}'.format(date)
+        for title, seconds in self.top_titles(day, day, 5, uncategorized=True):
+            hr, mn, sec = Sec2hms(seconds)
+            print('{0: 6}:{1:02}:{2:02} h    {3}'.format(hr, mn, sec, title))
+
+        u_projs, p_dur = self.analyze_projects(logfile)
+        if np.sum(p_dur) > 0:
+            print('-------------------------------------')
+            for proj, dur in zip(u_projs, p_dur):
+                if dur > 0:
+                    hr, mn, sec = Sec2hms(dur)
+                    print('{0: 6}:{1:02}:{2:02} h  project {3}'.format(hr, mn, sec, proj))
 
 
     def get_log_list(self):
-        log_list = os.listdir(self.path_data)
+        # days converted by binlog.py or archived by archive.py may no longer have their csv
+        log_list = (set(os.listdir(self.path_data)) | set(binlog.list_days(self.path_data))
+                    | set(archive.list_days(self.path_data)))
         date_list = []
         outlog_list =[]
-        for log in log_list:
+        for log in sorted(log_list):
             file_extension = Path(log).suffix
             if file_extension == '.csv':
                 date_list.insert(0,datetime.datetime.strptime(log[0:10], '%Y-%m-%d'))
@@ -353,6 +729,118 @@ test:
         return outlog_list, date_list
 
 
+    def get_day_totals(self, log_list):
+        # seconds per category for every log, only new or changed files are parsed
+        # and put into the summary store with their projects and titles
+        summary = self.summary.load()
+        totals = {}
+        changed = []
+        for log in log_list:
+            live = self._live_for(log)
+            if live is not None:
+                totals[log] = live.get_totals()
+                continue
+            stat = self._log_stat(self.path_data + '/' + log)
+            entry = summary.get(log)
+            if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+                durations, titles, projects = self._aggregate(log)
+                changed.append((log, stat.st_size, stat.st_mtime_ns, durations, titles, projects))
+            else:
+                durations = entry[2]
+            totals[log] = durations
+        self.summary.update(changed)
+        return totals
+
+    def get_day_projects(self, log_list):
+        # seconds per project for every log, same caching as get_day_totals
+        self.get_day_totals(log_list)
+        stored = self.summary.load_projects()
+        projects = {}
+        for log in log_list:
+            live = self._live_for(log)
+            if live is not None:
+                projects[log] = live.get_projects()
+            else:
+                projects[log] = stored.get(log, {})
+        return projects
+
+    def summarize(self, start=None, end=None, freq='W'):
+        # seconds per category and period for all days from start to end
+        # (inclusive), e.g. freq 'D', 'W', 'M' or 'Y'. Day totals come from the
+        # summary store, only logs that changed since the last call are read.
+        start = None if start is None else pd.Timestamp(start).strftime('%Y-%m-%d')
+        end = None if end is None else pd.Timestamp(end).strftime('%Y-%m-%d')
+        log_list, _ = self.get_log_list()
+        logs = [log for log in log_list if (start is None or log[:10] >= start) and (end is None or log[:10] <= end)]
+        day_totals = self.get_day_totals(logs)
+        rows = [(log[:10], category, seconds)
+                for log, totals in day_totals.items() for category, seconds in totals.items()]
+        days = pd.DataFrame(rows, columns=['day', 'category', 'seconds'])
+        days['period'] = pd.to_datetime(days.day).dt.to_period(freq)
+        summary = days.groupby(['period', 'category'], sort=True).seconds.sum().reset_index()
+        return summary[summary.seconds > 0].reset_index(drop=True)
+
+    def print_summary(self, start=None, end=None, freq='W'):
+        summary = self.summarize(start, end, freq)
+        if summary.empty:
+            print('no data between {} and {}'.format(start or 'first log', end or 'today'))
+            return
+        hours = summary.pivot(index='period', columns='category', values='seconds').fillna(0) / 3600
+        hours['total'] = hours.sum(axis=1)
+        print('hours per category and period ({})'.format(freq))
+        print(hours.round(1).to_string())
+
+    def _aggregate(self, logfile):
+        # seconds per category, the rows of the title index and the seconds
+        # per project of one log
+        df = self._read_log(self.path_data + '/' + logfile)
+        duration = pd.to_numeric(df.duration, errors='coerce').fillna(0)
+        return (duration.groupby(df.category, observed=True).sum().to_dict(), aggregate_titles(df),
+                self._project_durations(df, duration))
+
+    def _project_durations(self, df, duration):
+        # idle time counts for no project
+        if 'project' not in df:
+            return {}
+        mask = (df.category != 'idle').values & df.project.notna().values & (df.project != '').values
+        return duration[mask].groupby(df.project[mask], observed=True).sum().to_dict()
+
+    def top_titles(self, start=None, end=None, n=10, by='title', uncategorized=False, prefix=None):
+        # [(title, seconds)] with the most time from start to end, by='app'
+        # for applications. uncategorized: only the time that print_review
+        # reports as not categorized
+        start = None if start is None else pd.Timestamp(start).strftime('%Y-%m-%d')
+        end = None if end is None else pd.Timestamp(end).strftime('%Y-%m-%d')
+        log_list, _ = self.get_log_list()
+        # brings the index up to date with new or changed logs
+        self.get_day_totals([log for log in log_list
+                             if (start is None or log[:10] >= start) and (end is None or log[:10] <= end)])
+        return self._top_titles(start, end, n, by, uncategorized, prefix)
+
+    def search_titles(self, prefix, start=None, end=None, n=20, by='title'):
+        return self.top_titles(start, end, n, by, prefix=normalize_title(prefix))
+
+    def _top_titles(self, start, end, n, by, uncategorized, prefix=None):
+        exclude = ()
+        if uncategorized:
+            exclude = self.get_unique_categories() + ['idle']
+        live = self.live
+        if live is not None:
+            day = live.logfile()[:10]
+            if (start is not None and day < start) or (end is not None and day > end):
+                live = None
+        if live is None:
+            return self.summary.title_totals(by, start, end, prefix, exclude, n)
+
+        # the running totals stand in for whatever the store has of today
+        totals = dict(self.summary.title_totals(by, start, end, prefix, exclude, skip_logfile=live.logfile()))
+        for title, category, seconds in live.title_rows():
+            key = title if by == 'title' else app_name(title)
+            if category in exclude or (prefix and not key.startswith(prefix)):
+                continue
+            totals[key] = totals.get(key, 0) + seconds
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:n]
+
     def get_unique_categories(self, string_cats=''):
         if string_cats == '':
             string_cats = self.string_cats
@@ -364,87 +852,181 @@ test:
 
 
     def get_cat(self, window):
-        ret = 'not categorized'
         if len(window) <=1:
             return 'idle' #this is a "pre-defined" cat in script.py
-        for string, category in self.string_cats:
-            try:
-                match = re.search(string, window)
-                if bool(match):
-                    return category
-            except TypeError:
-                pass
-            ret = category
-        return ret
+        return self.matcher.match(window)
 
-    def create_html(self, logfile=''):
-        # check the filename does not contain "mod.log" to avoid crash
-        if "mod.log" in logfile:
-            return
+    def get_project(self, window):
+        # same cached match as get_cat, no second pass over the rules
+        if len(window) <=1:
+            return ''
+        return self.matcher.project(window)
 
-        week_days=["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"]
-        _, u_dur, date, df = self.analyze(logfile)
+    def get_unique_projects(self):
+        u_projs = []
+        for pattern, project in self.proj_list:
+            if project not in u_projs:
+                u_projs.append(project)
+        return u_projs
+
+    def create_html(self, logfile=''):
+        # one page per month, html/index.html is the current month. The table
+        # and the images are rendered in the browser from a small data file
+        # per month, which is only written when a log of that month changed.
+        parses = self.parse_count
         log_list, date_list = self.get_log_list()
         u_cats = self.get_unique_categories()
+        u_projs = self.get_unique_projects()
         colors = self.get_colors(logfile)
 
+        self.print_pi_chart()
+        self.print_timeline()
+
+        # newest month first, the days of a month oldest first as in the old table
+        months = OrderedDict()
+        for log in log_list:
+            months.setdefault(log[:7], []).insert(0, log)
+        images = {}
+        for img in sorted(os.listdir('figs/pie'), reverse=True):
+            images.setdefault(img[:7], []).append(img)
+
+        os.makedirs('html/data', exist_ok=True)
+        signatures = self._load_month_signatures()
         with open('html/head.txt', 'r', encoding='utf-8') as file:
-            head = file.readlines()
+            head = file.read()
         with open('html/tail.txt', 'r', encoding='utf-8') as file:
             tail = file.read()
 
-        with open('html/index.html', 'w', encoding='utf-8') as file:
-
-            # TABLE
-            file.writelines(head)
-            row = '<table style="width:100%">\n'
-            row += '<tr>\n<td></td>'
-            for idx, cat in enumerate(u_cats):
-                row += '<td style="background-color:{}"><b>{}</b></td>\n'.format(colors[idx], cat)
-            row += '<td><b>Total Time</b></td></tr>'
-
-            self.print_pi_chart()
-            self.print_timeline()
-            for log in reversed(log_list):
-                row += '<tr>\n\t<td>'
-                u_cat, u_dur, date, df = self.analyze(log)
+        week_days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+        written = 0
+        for idx, (month, logs) in enumerate(months.items()):
+            page_path = 'html/index.html' if idx == 0 else 'html/{}.html'.format(month)
+            signature = self._month_signature(logs, images.get(month, []))
+            if signatures.get(month) == signature and os.path.isfile(page_path):
+                continue
+            day_totals = self.get_day_totals(logs)
+            day_projects = self.get_day_projects(logs)
+            days = []
+            for log in logs:
                 date = datetime.datetime.strptime(log[0:10], '%Y-%m-%d')
-                row += '<b>{0:02}.{1:02}.{2:04},{3}</b>'.format(date.month, date.day, date.year,week_days[date.weekday()])
-                row += '</td>'
-                total_time =0
-                for idx, dur in enumerate(u_dur):
-                    total_time = total_time + dur
-                    dur_hr = int(np.floor(dur/3600))
-                    dur_min = int(np.floor((dur-dur_hr*3600)/60))
-                    dur_sec = int(dur%60)
-                    row += '<td style="background-color:{}">'.format(colors[idx])
-                    row += '{0: 6}:{1:02}:{2:02}'.format(dur_hr, dur_min, dur_sec)
-                    row += '</td>\n'
-                tot_time = sec2str(total_time)
-                row += '<td>{0: 6}:{1:02}:{2:02}</td>'.format(tot_time[0],tot_time[1],tot_time[2])
-                row += '</tr>\n'
-
-            row += '<tr>\n<td></td>'
-            for idx, cat in enumerate(u_cats):
-                row += '<td style="background-color:{}"><b>{}</b></td>\n'.format(colors[idx], cat)
-            row += '<td><b>Total Time</b></td></tr>'
-
-            file.write(row)
-            file.write('</table>\n')
-
-            # images
-            file.write('<div class="gallery">\n')
-            img_list = os.listdir('figs/pie')
-            for img in reversed(img_list):
-                img_row = '<div style="display: flex; justify-content: space-around;">\n'
-                img_row += '<img src="../figs/pie/{}"  width="450" height="450" >\n'.format(img)
-                img_row += '<img src="../figs/timeline/{}"  width="450" height="450" >\n'.format(img)
-                img_row += '</div></br>\n'
-                file.write(img_row)
-            file.write('</div>\n')
-            file.writelines(tail)
-        print('html updated')
+                days.append({
+                    'label': '{0:02}.{1:02}.{2:04},{3}'.format(date.month, date.day, date.year, week_days[date.weekday()]),
+                    'durations': [float(day_totals[log].get(cat, 0)) for cat in u_cats],
+                    'projects': [float(day_projects[log].get(proj, 0)) for proj in u_projs],
+                })
+            month_data = {'month': month, 'categories': u_cats, 'colors': colors, 'projects': u_projs,
+                          'days': days, 'images': images.get(month, []),
+                          'uncategorized': self._top_titles(month + '-01', month + '-31', 10, 'title', True)}
+            self._write_text('html/data/{}.js'.format(month), 'month_data = ' + json.dumps(month_data) + ';\n')
+            self._write_text(page_path, head + _MONTH_PAGE.format(month=month) + tail)
+            signatures[month] = signature
+            written += 1
+
+        if written:
+            self._write_text('html/data/months.json', json.dumps(signatures))
+        # only changes when a new month starts, the navigation of all pages reads it
+        self._write_text('html/data/months.js', 'months = ' + json.dumps(list(months)) + ';\n')
+        stats = self.chart_stats()
+        print('html updated ({} log parses, {} of {} months written, charts {} skipped / {} drawn, {:.2f} s saved)'.format(
+            self.parse_count - parses, written, len(months), stats['hits'], stats['misses'], stats['saved_seconds']))
+
+    def _month_signature(self, logs, images):
+        # changes whenever a log, today's running totals, the config or the
+        # charts of the month change
+        parts = [self.config_digest, images]
+        for log in logs:
+            live = self._live_for(log)
+            if live is not None:
+                parts.append((log, 'live', live.events))
+            else:
+                stat = self._log_stat(self.path_data + '/' + log)
+                parts.append((log, stat.st_size, stat.st_mtime_ns))
+        return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    def _load_month_signatures(self):
+        # delete html/data/months.json to rebuild every month page
+        try:
+            with open('html/data/months.json', 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_text(self, path, text):
+        # unchanged files are left alone, the browser may reload the page at
+        # any time and must never see it half written
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                if file.read() == text:
+                    return
+        except OSError:
+            pass
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(tmp_path, path)
+
+
+# body of a month page, html/data/<month>.js defines month_data and
+# html/data/months.js the list of all months. Plain scripts instead of fetch()
+# so the pages also work when opened from disk.
+_MONTH_PAGE = """
+<p id="nav"></p>
+<table style="width:100%" id="table"></table>
+<h3>not categorized</h3>
+<table id="titles"></table>
+<div class="gallery" id="gallery"></div>
+<script src="data/months.js"></script>
+<script src="data/{month}.js"></script>
+<script>
+function hms(sec) {{
+    var hr = Math.floor(sec / 3600), mn = Math.floor(sec % 3600 / 60), s = Math.floor(sec % 60);
+    return ('     ' + hr).slice(-6) + ':' + ('0' + mn).slice(-2) + ':' + ('0' + s).slice(-2);
+}}
+function header_row() {{
+    var row = '<tr><td></td>';
+    month_data.categories.forEach(function (cat, idx) {{
+        row += '<td style="background-color:' + month_data.colors[idx] + '"><b>' + cat + '</b></td>';
+    }});
+    row += '<td><b>Total Time</b></td>';
+    month_data.projects.forEach(function (proj) {{
+        row += '<td><i>' + proj + '</i></td>';
+    }});
+    return row + '</tr>';
+}}
+document.getElementById('nav').innerHTML = months.map(function (month, idx) {{
+    if (month == month_data.month) return '<b>' + month + '</b>';
+    return '<a href="' + (idx == 0 ? 'index' : month) + '.html">' + month + '</a>';
+}}).join(' | ');
+var rows = header_row();
+month_data.days.forEach(function (day) {{
+    var total = 0;
+    rows += '<tr><td><b>' + day.label + '</b></td>';
+    day.durations.forEach(function (dur, idx) {{
+        total += dur;
+        rows += '<td style="background-color:' + month_data.colors[idx] + '">' + hms(dur) + '</td>';
+    }});
+    rows += '<td>' + hms(total) + '</td>';
+    day.projects.forEach(function (dur) {{
+        rows += '<td>' + hms(dur) + '</td>';
+    }});
+    rows += '</tr>';
+}});
+document.getElementById('table').innerHTML = rows + header_row();
+document.getElementById('titles').innerHTML = month_data.uncategorized.map(function (entry) {{
+    var title = document.createElement('td');
+    title.textContent = entry[0];
+    return '<tr><td>' + hms(entry[1]) + '</td>' + title.outerHTML + '</tr>';
+}}).join('');
+// the browser only loads the charts that are scrolled into view
+document.getElementById('gallery').innerHTML = month_data.images.map(function (img) {{
+    return '<div style="display: flex; justify-content: space-around;">' +
+        '<img src="../figs/pie/' + img + '" width="450" height="450" loading="lazy">' +
+        '<img src="../figs/timeline/' + img + '" width="450" height="450" loading="lazy">' +
+        '</div></br>';
+}}).join('');
+</script>
+"""
 
 
 if __name__ == '__main__':
-    main()
+    main(sys.argv[1:])
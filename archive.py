@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Monthly archives of the day logs of finished months.
+
+'python archive.py' rolls every month before the current one into a single
+file 'data/archive/2018-08.wra' and deletes the day logs and binary copies
+it replaced, '--keep' leaves them in place. Analytics reads the archived
+days like any other day, 'data' then only holds the current month.
+
+An archive is the magic number, one zlib compressed block per day (the
+binlog.py records and the string table of the day), a json index
+{logfile: [offset, length, rows]} and the offset of the index in the last
+8 bytes. The index of an archive is read once per process, a day is then
+one seek and one read.
+
+A day log that script.py still has open, e.g. the last day of the month just
+after midnight, is left for the next run.
+"""
+import os
+import sys
+import json
+import zlib
+import struct
+import datetime
+import numpy as np
+import binlog
+from event_writer import log_in_use
+
+ARC_HEADER = b'WRARC\x00\x01\x00'
+_indexes = {} # archive path -> ((mtime, size), {logfile: [offset, length, rows]})
+
+
+def archive_path(folder, month):
+    return os.path.join(folder, 'archive', month + '.wra')
+
+
+def list_archives(folder='data'):
+    archive_folder = os.path.join(folder, 'archive')
+    if not os.path.isdir(archive_folder):
+        return []
+    return sorted(os.path.join(archive_folder, name) for name in os.listdir(archive_folder)
+                  if name.endswith('.wra'))
+
+
+def read_index(path):
+    # {logfile: [offset, length, rows]} of an archive, cached until the file changes
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {}
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _indexes.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path, 'rb') as file:
+        if file.read(len(ARC_HEADER)) != ARC_HEADER:
+            raise ValueError('{} is not a log archive'.format(path))
+        file.seek(-8, os.SEEK_END)
+        offset, = struct.unpack('<Q', file.read(8))
+        file.seek(offset)
+        index = json.loads(file.read(stat.st_size - 8 - offset).decode('utf-8'))
+    _indexes[path] = (key, index)
+    return index
+
+
+def list_days(folder='data'):
+    # csv style names of all archived days
+    days = []
+    for path in list_archives(folder):
+        days.extend(read_index(path))
+    return days
+
+
+def find_day(csv_path):
+    # the archive that holds this day, or None
+    folder, logfile = os.path.split(csv_path)
+    path = archive_path(folder, logfile[:7])
+    if logfile in read_index(path):
+        return path
+    return None
+
+
+def read_records(path, logfile):
+    offset, length, _ = read_index(path)[logfile]
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        block = zlib.decompress(file.read(length))
+    size, = struct.unpack('<Q', block[:8])
+    records = np.frombuffer(block, dtype=binlog.RECORD, count=size // binlog.RECORD.itemsize, offset=8)
+    strings = block[8 + size:].decode('utf-8').split('\n')
+    return records, strings
+
+
+def read_day(path, logfile):
+    return binlog.frame(*read_records(path, logfile))
+
+
+def read_all(path):
+    # {logfile: (records, strings)} of every day of an archive
+    return {logfile: read_records(path, logfile) for logfile in sorted(read_index(path))}
+
+
+def write(path, days):
+    # days: {logfile: (records, strings)}, written to a temp file that then
+    # replaces the archive in one step
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    index = {}
+    with open(tmp_path, 'wb') as file:
+        file.write(ARC_HEADER)
+        for logfile in sorted(days):
+            records, strings = days[logfile]
+            records = np.ascontiguousarray(records, dtype=binlog.RECORD)
+            block = zlib.compress(struct.pack('<Q', records.nbytes) + records.tobytes()
+                                  + '\n'.join(strings).encode('utf-8'))
+            index[logfile] = [file.tell(), len(block), len(records)]
+            file.write(block)
+        offset = file.tell()
+        file.write(json.dumps(index).encode('utf-8'))
+        file.write(struct.pack('<Q', offset))
+    os.replace(tmp_path, path)
+    return index
+
+
+def reclassify(path, classify, dry_run=False):
+    # binlog.reclassify_records for every day of an archive, the archive is
+    # written once. Returns {logfile: changes}.
+    days = {}
+    changes = {}
+    for logfile, (records, strings) in read_all(path).items():
+        records, strings, changes[logfile] = binlog.reclassify_records(records, strings, classify)
+        days[logfile] = (records, strings)
+    if any(changes.values()) and not dry_run:
+        write(path, days)
+    return changes
+
+
+def _loose_days(folder, month):
+    # {logfile: (records, strings)} of the days of a month outside the
+    # archive, the files they came from and the days still being recorded
+    days = {}
+    files = []
+    recording = []
+    logs = set(name for name in os.listdir(folder) if name.endswith('.csv')) | set(binlog.list_days(folder))
+    for logfile in sorted(logs):
+        if logfile[:7] != month:
+            continue
+        csv_path = os.path.join(folder, logfile)
+        rec_path, str_path = binlog.bin_paths(csv_path)
+        if log_in_use(csv_path):
+            recording.append(logfile)
+            continue
+        if binlog.newer_binary(csv_path) is not None:
+            days[logfile] = binlog.upgrade(*binlog.read_records(csv_path))
+        else:
+            days[logfile] = binlog.encode(binlog.read_csv(csv_path))
+        # a lock file is left behind when script.py was killed
+        files += [path for path in [csv_path, rec_path, str_path, csv_path + '.lock'] if os.path.isfile(path)]
+    return days, files, recording
+
+
+def compact(folder='data', keep=False, today=None):
+    # archive every finished month, days already in an archive are kept
+    # unless a newer day log of the same day turns up
+    today = today or datetime.date.today()
+    current = '{:%Y-%m}'.format(today)
+    logs = set(name for name in os.listdir(folder) if name.endswith('.csv')) | set(binlog.list_days(folder))
+    months = sorted(set(log[:7] for log in logs if log[:7] < current))
+    archived = 0
+    for month in months:
+        path = archive_path(folder, month)
+        days, files, recording = _loose_days(folder, month)
+        for logfile in recording:
+            print('{} is still recorded by script.py, left for the next run'.format(logfile))
+        if not days:
+            continue
+        merged = read_all(path) if os.path.isfile(path) else {}
+        merged.update(days)
+        index = write(path, merged)
+        # read everything back before the day logs are deleted
+        for logfile, (records, _) in merged.items():
+            if index[logfile][2] != len(records) or len(read_records(path, logfile)[0]) != len(records):
+                raise RuntimeError('{} of {} did not read back, nothing deleted'.format(logfile, path))
+        if not keep:
+            for file in files:
+                os.remove(file)
+        archived += len(days)
+        print('{}: {} days archived, {} in total, {:.1f} kB'.format(
+            month, len(days), len(merged), os.path.getsize(path) / 1e3))
+    print('{} days of {} months archived to {}'.format(archived, len(months), os.path.join(folder, 'archive')))
+    return archived
+
+
+if __name__ == '__main__':
+    compact('data', keep='--keep' in sys.argv[1:])
@@ -0,0 +1,913 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the recorder and analytics hot paths.
+
+run 'python benchmark.py' for all benchmarks or name the ones you want,
+e.g. 'python benchmark.py get_cat'. 'suite' times every hot path at several
+sizes, save a run with '--json base.json' and check a later one against it
+with '--compare base.json --threshold 0.25', the run fails on a regression
+and when base.json has no suite timings of the same --scale.
+"""
+import os
+import re
+import json
+import argparse
+import sys
+import csv
+import time
+import random
+import shutil
+import datetime
+import tempfile
+from contextlib import contextmanager, redirect_stdout
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from category_matcher import CategoryMatcher
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+WORDS = ['chrome', 'mozilla', 'github', 'stackoverflow', 'outlook', 'word',
+         'excel', 'spyder', 'jira', 'confluence', 'youtube', 'news', 'mail',
+         'terminal', 'notes', 'calendar', 'slack', 'teams', 'python', 'review']
+
+
+def make_rules(n_rules, seed=0):
+    rnd = random.Random(seed)
+    cats = ['coding', 'learning', 'gaming', 'docs', 'wasted', 'mail', 'family']
+    rules = []
+    for idx in range(n_rules):
+        rules.append(('{}{:04d}'.format(rnd.choice(WORDS), idx), rnd.choice(cats)))
+    return rules
+
+
+def make_titles(n_titles, rules, n_unique=2000, hit_rate=0.7, seed=1):
+    rnd = random.Random(seed)
+    unique = []
+    for _ in range(n_unique):
+        words = [rnd.choice(WORDS) for _ in range(rnd.randint(3, 8))]
+        if rules and rnd.random() < hit_rate:
+            words.insert(rnd.randint(0, len(words)), rnd.choice(rules)[0])
+        unique.append(' - '.join(words))
+    return [rnd.choice(unique) for _ in range(n_titles)]
+
+
+def make_config(rules):
+    cats = []
+    for _, cat in rules:
+        if cat not in cats:
+            cats.append(cat)
+    text = '[SETTINGS]\nimage_folder = figs/pictures\nmd_folder = notes\n\n[CATEGORIES]\n'
+    text += ''.join('{}: {}\n'.format(string, cat) for string, cat in rules)
+    text += '\n[COLORS]\n'
+    text += ''.join('{}: #{:06X}\n'.format(cat, (idx * 0x3A5F17) % 0xFFFFFF) for idx, cat in enumerate(cats))
+    text += '\n[PROJECTS]\ntest:\n'
+    return text
+
+
+def write_day_log(path, day, n_events, titles, seed=2):
+    # a day of events in the format script.save_data writes
+    rnd = random.Random(seed)
+    t = datetime.datetime.combine(day, datetime.time(0, 5)).timestamp()
+    step = 86000 / max(n_events, 1)
+    with open(path, 'w') as file:
+        writer = csv.writer(file, delimiter=',', lineterminator="\r")
+        for _ in range(n_events):
+            duration = max(1, int(rnd.random() * step))
+            t += step
+            title = rnd.choice(titles)
+            writer.writerow([t, 'not categorized', duration, title])
+
+
+@contextmanager
+def workspace(rules, days=(), n_events=1000, titles=None):
+    # temporary working directory laid out like the repo, Analytics works on cwd
+    cwd = os.getcwd()
+    folder = tempfile.mkdtemp(prefix='wr_bench_')
+    try:
+        os.chdir(folder)
+        for sub in ['data', 'figs/pie', 'figs/timeline', 'html']:
+            os.makedirs(sub)
+        shutil.copy(os.path.join(REPO, 'html', 'head.txt'), 'html')
+        shutil.copy(os.path.join(REPO, 'html', 'tail.txt'), 'html')
+        with open('config.dat', 'w', encoding='utf-8') as file:
+            file.write(make_config(rules))
+        titles = titles or make_titles(500, rules, n_unique=500)
+        for day in days:
+            write_day_log('data/{:%Y-%m-%d}.csv'.format(day), day, n_events, titles)
+        yield folder
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def legacy_get_cat(string_cats, window):
+    # the per-rule loop Analytics.get_cat used before the compiled matcher
+    ret = 'not categorized'
+    for string, category in string_cats:
+        if re.search(string, window):
+            return category
+        ret = category
+    return ret
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_get_cat(n_titles=100000, n_rules=1000, sample=2000):
+    rules = make_rules(n_rules)
+    titles = make_titles(n_titles, rules)
+    # the uncached variants are timed on a sample and scaled up to n_titles,
+    # the per-rule loop would take tens of minutes on the full log
+    subset = titles[:sample]
+    scale = n_titles / len(subset)
+
+    t_legacy, legacy = timed(lambda: [legacy_get_cat(rules, t) for t in subset])
+    matcher = CategoryMatcher(rules, rules[-1][1], cache_size=0)
+    t_nocache, compiled = timed(lambda: [matcher.match(t) for t in subset])
+    t_build, matcher = timed(CategoryMatcher, rules, rules[-1][1])
+    t_new, new = timed(lambda: [matcher.match(t) for t in titles])
+
+    assert legacy == compiled == new[:sample], 'compiled matcher disagrees with the per-rule loop'
+    t_legacy *= scale
+    t_nocache *= scale
+    print('get_cat: {} titles, {} rules'.format(n_titles, n_rules))
+    print('  per-rule re.search   {:8.3f} s (scaled from {} titles)'.format(t_legacy, sample))
+    print('  compiled, no cache   {:8.3f} s (scaled from {} titles)  {:.1f}x'.format(t_nocache, sample, t_legacy / t_nocache))
+    print('  compiled + lru cache {:8.3f} s  {:.1f}x, build {:.3f} s'.format(t_new, t_legacy / t_new, t_build))
+    return {'legacy': t_legacy, 'compiled': t_nocache, 'cached': t_new, 'build': t_build}
+
+
+def legacy_timeline(df, u_cats, colors, path):
+    # one plt.plot per event, as Analytics.print_timeline used to draw
+    plt.title('')
+    for idx, u_cat in enumerate(u_cats):
+        temp = df.loc[df.category == u_cat]
+        time_ = temp.time.values
+        duration = temp.duration.values
+        for entry in range(len(time_)):
+            start = datetime.datetime.fromtimestamp(float(time_[entry]) - float(duration[entry]))
+            end = datetime.datetime.fromtimestamp(float(time_[entry]))
+            plt.plot([start, end], [idx, idx], '-.', linewidth=7, color=colors[idx])
+    plt.savefig(path)
+    plt.close()
+
+
+def bench_timeline(n_events=10000, n_rules=50):
+    from analytics import Analytics
+    rules = make_rules(n_rules)
+    day = datetime.date.today()
+    logfile = '{:%Y-%m-%d}.csv'.format(day)
+    with workspace(rules, [day], n_events):
+        analytic = Analytics()
+        analytic.redo_cat(logfile)
+        df = analytic._read_log('data/' + logfile)
+        u_cats = analytic.get_unique_categories()
+        colors = analytic.get_colors(logfile)
+        t_legacy, _ = timed(legacy_timeline, df, u_cats, colors, 'legacy.png')
+        t_new, _ = timed(analytic.print_timeline, logfile)
+    print('print_timeline: {} events'.format(n_events))
+    print('  plt.plot per event   {:8.3f} s'.format(t_legacy))
+    print('  line collections     {:8.3f} s  {:.1f}x'.format(t_new, t_legacy / t_new))
+    return {'legacy': t_legacy, 'vectorized': t_new}
+
+
+def bench_charts(n_events=10000, n_rules=50, n_refreshes=10):
+    # dashboard refreshes while nothing new was recorded, e.g. during a break
+    from analytics import Analytics
+    rules = make_rules(n_rules)
+    day = datetime.date.today()
+    logfile = '{:%Y-%m-%d}.csv'.format(day)
+    with workspace(rules, [day], n_events):
+        analytic = Analytics()
+        analytic.redo_cat(logfile)
+
+        def refresh():
+            analytic.print_pi_chart(logfile)
+            analytic.print_timeline(logfile)
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            t_first, _ = timed(refresh)
+            t_same, _ = timed(lambda: [refresh() for _ in range(n_refreshes)])
+        stats = analytic.chart_stats()
+    print('charts: {} events, {} refreshes without new data'.format(n_events, n_refreshes))
+    print('  drawn      {:8.3f} s per refresh'.format(t_first))
+    print('  unchanged  {:8.3f} s per refresh, {} skipped / {} drawn, {:.2f} s matplotlib saved'.format(
+        t_same / n_refreshes, stats['hits'], stats['misses'], stats['saved_seconds']))
+    return {'drawn_s': t_first, 'unchanged_s': t_same / n_refreshes, 'hits': stats['hits'],
+            'misses': stats['misses']}
+
+
+def legacy_save_data(data, folder):
+    # open, append one row and close for every event, the old script.save_data
+    today = datetime.datetime.now()
+    filename = '{0:d}-{1:02d}-{2:02d}.csv'.format(today.year, today.month, today.day)
+    path = folder + filename
+    if not os.path.isdir(folder):
+        os.mkdir(folder)
+    with open(path, 'a') as file:
+        writer = csv.writer(file, delimiter=',', lineterminator="\r")
+        writer.writerow(data)
+
+
+def bench_writer(n_events=20000):
+    from event_writer import EventWriter
+    rows = [[time.time(), 'coding', 12, 'github - window recorder - chrome']] * n_events
+    with workspace([]):
+        t_legacy, _ = timed(lambda: [legacy_save_data(row, 'legacy/') for row in rows])
+        writer = EventWriter('buffered')
+        t_new, _ = timed(lambda: ([writer.write(row) for row in rows], writer.close()))
+    print('event writer: {} events'.format(n_events))
+    print('  open per event       {:10.0f} events/s'.format(n_events / t_legacy))
+    print('  buffered writer      {:10.0f} events/s  {:.1f}x'.format(n_events / t_new, t_legacy / t_new))
+    return {'legacy': n_events / t_legacy, 'buffered': n_events / t_new}
+
+
+def make_trace(seconds=3600, mean_gap=40, seed=3):
+    # (time, window, idle) whenever something changes, like a user would
+    rnd = random.Random(seed)
+    titles = make_titles(200, make_rules(50), n_unique=200)
+    trace = []
+    t = 0.0
+    while t < seconds:
+        idle = rnd.random() < 0.05
+        trace.append((t, rnd.choice(titles), idle))
+        t += rnd.expovariate(1.0 / mean_gap) + 0.5
+    return trace
+
+
+def run_sampler(sampler, recorder, clock, end):
+    # the main loop of script.py without the printing
+    events = 0
+    start = time.process_time()
+    for sample in sampler:
+        if recorder.feed(sample) is not None:
+            events += 1
+        if clock() >= end:
+            break
+    return time.process_time() - start, events
+
+
+def bench_sampler(hours=1):
+    import bisect
+    from recorder import Recorder
+    from sampler import PollingSampler, ScriptedSampler
+    end = hours * 3600
+    trace = make_trace(end)
+    times = [t for t, _, _ in trace]
+    matcher = CategoryMatcher(make_rules(50))
+    now = [0.0]
+
+    def clock():
+        return now[0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    def current():
+        return trace[bisect.bisect_right(times, now[0]) - 1]
+
+    results = {}
+    for name, min_interval, max_interval in [('fixed 10 ms', 0.01, 0.01), ('adaptive', 0.01, 0.5)]:
+        now[0] = 0.0
+        sampler = PollingSampler(lambda: current()[1], lambda: current()[2], min_interval=min_interval,
+                                 max_interval=max_interval, clock=clock, sleep=sleep)
+        cpu, events = run_sampler(sampler, Recorder(matcher.match), clock, end)
+        results[name] = (sampler.wakeups, cpu, events)
+
+    # event driven: one sample per change plus the one second heartbeat of the loop
+    samples = sorted(trace + [(float(t), None, None) for t in range(end)], key=lambda s: s[0])
+    last = trace[0]
+    scripted = []
+    for sample in samples:
+        if sample[1] is not None:
+            last = sample
+        scripted.append((sample[0], last[1], last[2]))
+    sampler = ScriptedSampler(scripted)
+    cpu, events = run_sampler(sampler, Recorder(matcher.match), lambda: 0, end)
+    results['event driven'] = (sampler.wakeups, cpu, events)
+
+    print('sampler: {} recorded hour(s), {} window changes'.format(hours, len(trace)))
+    for name, (wakeups, cpu, events) in results.items():
+        print('  {:14s} {:8d} wakeups/h  {:7.3f} s cpu/h  {} events'.format(name, int(wakeups / hours), cpu / hours, events))
+    return {name: {'wakeups': w / hours, 'cpu': c / hours} for name, (w, c, _) in results.items()}
+
+
+def bench_replay(n_events=20000, n_rules=1000):
+    import script
+    rules = make_rules(n_rules)
+    day = datetime.date.today()
+    with workspace(rules, [day], n_events):
+        events, elapsed = script.replay(['data/{:%Y-%m-%d}.csv'.format(day)])
+    print('replay: {} trace rows, {} rules'.format(n_events, n_rules))
+    print('  {:10.0f} events/s through sampler, recorder, matcher and writer'.format(events / elapsed))
+    return {'events_per_s': events / elapsed}
+
+
+def folder_size(folder, suffixes):
+    return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)
+               if name.endswith(suffixes))
+
+
+def bench_binlog(n_days=365, n_events=1000):
+    import binlog
+    rules = make_rules(100)
+    first = datetime.date.today() - datetime.timedelta(days=n_days)
+    days = [first + datetime.timedelta(days=idx) for idx in range(n_days)]
+    with workspace(rules, days, n_events):
+        logs = ['data/{:%Y-%m-%d}.csv'.format(day) for day in days]
+        t_csv, _ = timed(lambda: [binlog.read_csv(log) for log in logs])
+        t_convert, _ = timed(binlog.convert, 'data')
+        t_bin, _ = timed(lambda: [binlog.read_day(log) for log in logs])
+        csv_size = folder_size('data', ('.csv',))
+        bin_size = folder_size('data/bin', ('.rec', '.str'))
+    print('binlog: {} days of {} events'.format(n_days, n_events))
+    print('  csv    load {:7.3f} s  {:8.1f} MB'.format(t_csv, csv_size / 1e6))
+    print('  binary load {:7.3f} s  {:8.1f} MB  {:.1f}x faster, convert {:.2f} s'.format(
+        t_bin, bin_size / 1e6, t_csv / t_bin, t_convert))
+    return {'csv_load': t_csv, 'bin_load': t_bin, 'csv_bytes': csv_size, 'bin_bytes': bin_size}
+
+
+def bench_title_dict(n_days=30, n_events=5000, n_windows=40, n_rules=100):
+    # a few dozen long browser titles on every row: plain strings against the
+    # categoricals of the csv and the per day string table of the binary copy
+    import pandas as pd
+    import binlog
+    from analytics import Analytics
+    from title_index import aggregate_titles
+    rules = make_rules(n_rules)
+    windows = [title + ' - ' + ' '.join(WORDS[:8]) for title in make_titles(n_windows, rules, n_unique=n_windows)]
+    first = datetime.date.today() - datetime.timedelta(days=n_days)
+    days = [first + datetime.timedelta(days=idx) for idx in range(n_days)]
+
+    def load_strings(path):
+        # the csv as it was loaded before, every title a python string
+        return pd.read_csv(path, encoding="ISO-8859-1", names=binlog.LOG_COLUMNS, sep=',')
+
+    def aggregate(df):
+        duration = pd.to_numeric(df.duration, errors='coerce').fillna(0)
+        return duration.groupby(df.category, observed=True).sum().to_dict(), aggregate_titles(df)
+
+    def memory(frames):
+        return sum(df.memory_usage(deep=True).sum() for df in frames)
+
+    def best(func, repeat=3):
+        # loads of a few ms per day are noisy, the fastest run counts
+        return min((timed(func) for _ in range(repeat)), key=lambda run: run[0])
+
+    results = {}
+    with workspace(rules, days, n_events, windows):
+        logs = ['data/{:%Y-%m-%d}.csv'.format(day) for day in days]
+        for name, load in [('strings', load_strings), ('categorical', binlog.read_csv)]:
+            t_load, frames = best(lambda: [load(log) for log in logs])
+            t_aggregate, _ = best(lambda: [aggregate(df) for df in frames])
+            results[name] = (t_load, t_aggregate, memory(frames), folder_size('data', ('.csv',)))
+        analytic = Analytics()
+        t_redo_csv, changed_csv = timed(lambda: sum(analytic.redo_cat(os.path.basename(log)) for log in logs))
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            binlog.convert('data', remove_csv=True)
+        t_load, frames = best(lambda: [binlog.read_day(log) for log in logs])
+        t_aggregate, _ = best(lambda: [aggregate(df) for df in frames])
+        results['binary'] = (t_load, t_aggregate, memory(frames), folder_size('data/bin', ('.rec', '.str')))
+        # new category names, every row changes again
+        with open('config.dat', 'w', encoding='utf-8') as file:
+            file.write(make_config([(pattern, category + ' new') for pattern, category in rules]))
+        analytic.reload_config()
+        t_redo_bin, changed_bin = timed(lambda: sum(analytic.redo_cat(os.path.basename(log)) for log in logs))
+    title_length = sum(len(title) for title in windows) / len(windows)
+    print('title dictionary: {} days of {} events, {} windows of {:.0f} characters'.format(
+        n_days, n_events, n_windows, title_length))
+    print('  {:22s}{:>9s}{:>12s}{:>12s}{:>10s}'.format('', 'load s', 'aggregate s', 'memory MB', 'disk MB'))
+    labels = {'strings': 'csv, title strings', 'categorical': 'csv, categorical', 'binary': 'binary, title ids'}
+    for name, (t_load, t_aggregate, mem, size) in results.items():
+        print('  {:22s}{:9.3f}{:12.3f}{:12.1f}{:10.2f}'.format(labels[name], t_load, t_aggregate, mem / 1e6, size / 1e6))
+    print('  reclassify csv    {:10.0f} rows/s ({} rows changed)'.format(changed_csv / t_redo_csv, changed_csv))
+    print('  reclassify binary {:10.0f} rows/s ({} rows changed), once per distinct title'.format(
+        changed_bin / t_redo_bin, changed_bin))
+    output = {'redo_csv_rows_per_s': changed_csv / t_redo_csv, 'redo_bin_rows_per_s': changed_bin / t_redo_bin}
+    for name, (t_load, t_aggregate, mem, size) in results.items():
+        output.update({name + '_load_s': t_load, name + '_aggregate_s': t_aggregate,
+                       name + '_memory_bytes': int(mem), name + '_disk_bytes': size})
+    return output
+
+
+def bench_archive(n_days=3*365, n_events=500, n_reads=200):
+    # day logs of three years against monthly archives: the directory scan,
+    # summarizing every day from scratch and reading single past days
+    import archive
+    from analytics import Analytics
+    rules = make_rules(50)
+    today = datetime.date.today()
+    days = [today - datetime.timedelta(days=idx) for idx in range(n_days)][::-1]
+    rnd = random.Random(4)
+    sample = ['{:%Y-%m-%d}.csv'.format(day) for day in rnd.sample(days[:-40], n_reads)]
+    results = {}
+    with workspace(rules, days, n_events):
+        for name in ['day logs', 'archives']:
+            if name == 'archives':
+                with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                    t_compact, _ = timed(archive.compact, 'data')
+            if os.path.isfile('data/summary.sqlite'):
+                os.remove('data/summary.sqlite')
+            archive._indexes.clear()
+            analytic = Analytics()
+            t_list, (logs, _) = timed(analytic.get_log_list)
+            t_totals, _ = timed(analytic.get_day_totals, logs)
+
+            def read_days():
+                for logfile in sample:
+                    analytic._frames.clear()
+                    analytic._read_log('data/' + logfile)
+            t_read, _ = timed(read_days)
+            files = sum(len(names) for _, _, names in os.walk('data')) - 1 # without summary.sqlite
+            size = folder_size('data', ('.csv',))
+            if os.path.isdir('data/archive'):
+                size += folder_size('data/archive', ('.wra',))
+            results[name] = (t_list, t_totals, t_read / n_reads, files, size)
+    print('archive: {} days of {} events, compacted in {:.2f} s'.format(n_days, n_events, t_compact))
+    print('  {:10s}{:>12s}{:>18s}{:>15s}{:>8s}{:>10s}'.format(
+        '', 'list s', 'summarize all s', 'one day ms', 'files', 'MB'))
+    for name, (t_list, t_totals, t_read, files, size) in results.items():
+        print('  {:10s}{:12.4f}{:18.3f}{:15.3f}{:8d}{:10.2f}'.format(name, t_list, t_totals, t_read * 1000, files, size / 1e6))
+    output = {'compact_s': t_compact}
+    for name, (t_list, t_totals, t_read, files, size) in results.items():
+        key = name.replace(' ', '_')
+        output.update({key + '_list_s': t_list, key + '_summarize_s': t_totals, key + '_day_s': t_read,
+                       key + '_files': files, key + '_bytes': size})
+    return output
+
+
+def bench_redo_cat(n_rows=500000, n_rules=1000):
+    from analytics import Analytics
+    rules = make_rules(n_rules)
+    day = datetime.date.today()
+    logfile = '{:%Y-%m-%d}.csv'.format(day)
+    with workspace(rules, [day], n_rows):
+        analytic = Analytics()
+        t_first, changed = timed(analytic.redo_cat, logfile)
+        t_again, _ = timed(analytic.redo_cat, logfile)
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            t_dry, _ = timed(analytic.redo_cat, logfile, True)
+    print('redo_cat: {} rows, {} rules'.format(n_rows, n_rules))
+    print('  reclassify   {:10.0f} rows/s ({} rows changed)'.format(n_rows / t_first, changed))
+    print('  dry run      {:10.0f} rows/s'.format(n_rows / t_dry))
+    print('  unchanged    {:10.3f} s, skipped for the same config version'.format(t_again))
+    return {'rows_per_s': n_rows / t_first, 'dry_rows_per_s': n_rows / t_dry, 'skip': t_again}
+
+
+def legacy_dedupe(path):
+    # the quadratic CATEGORIES scan Analytics._load_config used to run
+    categories = []
+    with open(path, 'r', encoding='utf-8') as f:
+        in_categories_section = False
+        for line in f:
+            line = line.strip()
+            if line == '[CATEGORIES]':
+                in_categories_section = True
+                continue
+            elif line.startswith('['):
+                in_categories_section = False
+                continue
+            if in_categories_section and ':' in line:
+                key, value = line.split(':', 1)
+                key = key.strip()
+                if key not in [k for k, v in categories]:
+                    categories.append((key, value.strip()))
+    return categories
+
+
+def bench_config(n_rules=5000):
+    import analytics
+    rules = make_rules(n_rules)
+    with workspace(rules):
+        analytics._config_cache.clear()
+        t_cold, analytic = timed(analytics.Analytics)
+        t_warm, _ = timed(analytics.Analytics)
+        os.utime('config.dat')
+        t_touched, _ = timed(analytic.reload_config)
+        t_legacy, _ = timed(legacy_dedupe, 'config.dat')
+    print('config: {} rules'.format(n_rules))
+    print('  cold start           {:8.3f} s'.format(t_cold))
+    print('  cached start         {:8.4f} s'.format(t_warm))
+    print('  touched, same hash   {:8.4f} s'.format(t_touched))
+    print('  old duplicate scan   {:8.3f} s (alone, without parsing or compiling)'.format(t_legacy))
+    return {'cold': t_cold, 'cached': t_warm, 'touched': t_touched, 'legacy_dedupe': t_legacy}
+
+
+def legacy_inline_image(image_path):
+    # full resolution PNG inlined as base64, what the inspirational page used to embed
+    import base64
+    from io import BytesIO
+    from PIL import Image
+    with Image.open(image_path) as img:
+        buffered = BytesIO()
+        img.save(buffered, format="PNG")
+        return base64.b64encode(buffered.getvalue()).decode()
+
+
+def bench_inspiration(n_photos=500, n_calls=5, size=(4000, 3000)):
+    import numpy as np
+    from PIL import Image
+    import broser_start
+    with workspace([]):
+        os.makedirs('pictures')
+        os.makedirs('notes')
+        with open('notes/2018-08-15.md', 'w', encoding='utf-8') as file:
+            file.write('# notes\n- todo\n')
+        rnd = np.random.RandomState(0)
+        for idx in range(5):
+            pixels = (rnd.rand(size[1], size[0], 3) * 255).astype('uint8')
+            Image.fromarray(pixels).save('pictures/photo{:03d}.jpg'.format(idx), quality=90)
+        for idx in range(5, n_photos):
+            shutil.copy('pictures/photo{:03d}.jpg'.format(idx % 5), 'pictures/photo{:03d}.jpg'.format(idx))
+        photos = sorted(os.listdir('pictures'))[:n_calls]
+        photo_size = os.path.getsize('pictures/' + photos[0])
+
+        t_legacy, inlined = timed(lambda: [legacy_inline_image('pictures/' + p) for p in photos])
+        t_cold, _ = timed(lambda: [broser_start.get_thumbnail('pictures/' + p) for p in photos])
+        t_warm, thumbs = timed(lambda: [broser_start.get_thumbnail('pictures/' + p) for p in photos])
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            t_page, _ = timed(broser_start.generate_inspirational_html, 'pictures', 'notes')
+        page_size = os.path.getsize('inspirational_image.html')
+        thumb_size = np.mean([os.path.getsize(t) for t in thumbs])
+        legacy_size = np.mean([len(i) for i in inlined])
+
+    print('inspirational page: {} photos of {}x{} ({:.1f} MB each)'.format(n_photos, size[0], size[1], photo_size / 1e6))
+    print('  inline base64 png    {:7.3f} s per page  {:8.1f} MB html'.format(t_legacy / n_calls, legacy_size / 1e6))
+    print('  thumbnail, first use {:7.3f} s per page  {:8.3f} MB picture'.format(t_cold / n_calls, thumb_size / 1e6))
+    print('  thumbnail, cached    {:7.4f} s per page, whole page {:.3f} s, {:.1f} kB html'.format(
+        t_warm / n_calls, t_page, page_size / 1e3))
+    return {'legacy_s': t_legacy / n_calls, 'legacy_bytes': legacy_size, 'cold_s': t_cold / n_calls,
+            'cached_s': t_warm / n_calls, 'thumb_bytes': thumb_size, 'html_bytes': page_size}
+
+
+def bench_dashboard(n_days=1000, n_events=200):
+    from analytics import Analytics
+    rules = make_rules(50)
+    today = datetime.date.today()
+    days = [today - datetime.timedelta(days=idx) for idx in range(n_days)][::-1]
+    with workspace(rules, days, n_events):
+        for day in days:
+            for sub in ['pie', 'timeline']:
+                open('figs/{}/{:%Y-%m-%d}.png'.format(sub, day), 'w').close()
+        analytic = Analytics()
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            t_cold, _ = timed(analytic.create_html)
+            before = {name: os.stat('html/' + name).st_mtime_ns for name in os.listdir('html')}
+            # a new event in today's log
+            with open('data/{:%Y-%m-%d}.csv'.format(today), 'a') as file:
+                csv.writer(file, lineterminator='\r').writerow(
+                    [time.time(), analytic.get_unique_categories()[0], 60, 'new window'])
+            t_warm, _ = timed(analytic.create_html)
+        touched = [name for name in os.listdir('html') if os.path.isfile('html/' + name)
+                   and os.stat('html/' + name).st_mtime_ns != before.get(name)]
+        touched += ['data/' + name for name in os.listdir('html/data')
+                    if os.stat('html/data/' + name).st_mtime_ns > max(before.values())]
+        with open('html/index.html', encoding='utf-8') as file:
+            index_size = len(file.read())
+        data_size = os.path.getsize('html/data/{:%Y-%m}.js'.format(today))
+    print('dashboard: {} days of {} events'.format(n_days, n_events))
+    print('  first build     {:7.3f} s'.format(t_cold))
+    print('  refresh         {:7.3f} s, {} files written: {}'.format(t_warm, len(touched), ', '.join(sorted(touched))))
+    print('  index.html {:.1f} kB + {:.1f} kB month data, was one page with {} rows and {} images'.format(
+        index_size / 1e3, data_size / 1e3, n_days, 2 * n_days))
+    return {'build_s': t_cold, 'refresh_s': t_warm, 'files_written': len(touched),
+            'index_bytes': index_size, 'month_data_bytes': data_size}
+
+
+def legacy_weekly(analytic, logs):
+    # what a caller had to do before summarize: analyze every day file
+    weeks = {}
+    for log in logs:
+        u_cats, u_dur, date, df = analytic.analyze(log)
+        week = weeks.setdefault(date.isocalendar()[:2], {})
+        for cat, dur in zip(u_cats, u_dur):
+            week[cat] = week.get(cat, 0) + dur
+    return weeks
+
+
+def bench_summarize(n_days=3*365, n_events=500, n_rules=100):
+    from analytics import Analytics
+    rules = make_rules(n_rules)
+    today = datetime.date.today()
+    days = [today - datetime.timedelta(days=idx) for idx in range(n_days)][::-1]
+    with workspace(rules, days, n_events):
+        analytic = Analytics()
+        logs, _ = analytic.get_log_list()
+        for log in logs:
+            analytic.redo_cat(log)
+        t_legacy, _ = timed(legacy_weekly, analytic, logs)
+        # a fresh summary store, every log is read once
+        os.remove('data/summary.sqlite')
+        analytic = Analytics()
+        t_cold, summary = timed(analytic.summarize, days[0], days[-1], 'W')
+        t_warm, _ = timed(analytic.summarize, days[0], days[-1], 'W')
+        t_month, _ = timed(analytic.summarize, days[0], days[-1], 'M')
+    print('summarize: {} days of {} events, {} rows per week and category'.format(n_days, n_events, len(summary)))
+    print('  analyze per day      {:8.3f} s'.format(t_legacy))
+    print('  summarize, cold      {:8.3f} s'.format(t_cold))
+    print('  summarize, cached    {:8.3f} s  {:.0f}x, per month {:.3f} s'.format(t_warm, t_legacy / t_warm, t_month))
+    return {'legacy_s': t_legacy, 'cold_s': t_cold, 'cached_s': t_warm, 'monthly_s': t_month}
+
+
+def legacy_top_titles(logs, u_cats, n):
+    # grep the logs by hand: read every day and group the titles
+    import pandas as pd
+    import binlog
+    frames = [binlog.read_csv('data/' + log) for log in logs]
+    df = pd.concat(frames)
+    df = df[~df.category.isin(u_cats + ['idle'])]
+    duration = pd.to_numeric(df.duration, errors='coerce').fillna(0)
+    return duration.groupby(df.title).sum().sort_values(ascending=False)[:n]
+
+
+def bench_titles(n_days=365, n_events=1000, n_rules=100):
+    from analytics import Analytics
+    rules = make_rules(n_rules)
+    today = datetime.date.today()
+    days = [today - datetime.timedelta(days=idx) for idx in range(n_days)][::-1]
+    titles = make_titles(5000, rules, n_unique=5000)
+    with workspace(rules, days, n_events, titles):
+        analytic = Analytics()
+        logs, _ = analytic.get_log_list()
+        u_cats = analytic.get_unique_categories()
+        t_legacy, _ = timed(legacy_top_titles, logs, u_cats, 20)
+        t_cold, _ = timed(analytic.top_titles, None, None, 20, 'title', True)
+        t_warm, top = timed(analytic.top_titles, None, None, 20, 'title', True)
+        t_app, _ = timed(analytic.top_titles, None, None, 20, 'app')
+        prefix = top[0][0][:3]
+        t_search, found = timed(analytic.search_titles, prefix)
+        n_titles = len(analytic.summary.title_totals())
+    print('title index: {} days of {} events, {} distinct titles'.format(n_days, n_events, n_titles))
+    print('  read all logs        {:8.3f} s'.format(t_legacy))
+    print('  index, first build   {:8.3f} s'.format(t_cold))
+    print('  top 20 not categorized {:6.3f} s  {:.0f}x, top apps {:.3f} s'.format(t_warm, t_legacy / t_warm, t_app))
+    print('  prefix {!r:8}       {:8.3f} s, {} titles'.format(prefix, t_search, len(found)))
+    return {'legacy_s': t_legacy, 'build_s': t_cold, 'top_s': t_warm, 'apps_s': t_app, 'search_s': t_search}
+
+
+# rows per day, days and rules the suite is run with, each swept on its own
+SCALES = {
+    'small': {'rows': [1000, 10000], 'days': [1, 30], 'rules': [10, 1000]},
+    'full': {'rows': [1000, 10000, 100000], 'days': [1, 100, 1000], 'rules': [10, 1000, 5000]},
+}
+
+
+def fresh_analytics():
+    # every size starts without the compiled rules and their match cache
+    import analytics
+    analytics._config_cache.clear()
+    return analytics.Analytics()
+
+
+def bench_suite(scale='small', repeat=3, n_titles=2000, trace_hours=8):
+    # seconds of every hot path at the sizes of SCALES, these are the numbers
+    # --compare checks for regressions. The best of 'repeat' runs is kept,
+    # a single run is too noisy for a threshold
+    results = {}
+
+    def record(name, func, *args):
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            seconds, _ = timed(func, *args)
+        results[name] = min(seconds, results.get(name, seconds))
+
+    for _ in range(repeat):
+        run_suite(SCALES[scale], record, n_titles, trace_hours)
+    print('suite ({}, best of {}):'.format(scale, repeat))
+    for name, seconds in results.items():
+        print('  {:32s} {:9.4f} s'.format(name, seconds))
+    return results
+
+
+def run_suite(sizes, record, n_titles, trace_hours):
+    import script
+    from probes import ReplayProbe
+    today = datetime.date.today()
+    logfile = '{:%Y-%m-%d}.csv'.format(today)
+    for n_rules in sizes['rules']:
+        rules = make_rules(n_rules)
+        titles = make_titles(n_titles, rules, n_unique=n_titles)
+        with workspace(rules, [today], 1000):
+            analytic = fresh_analytics()
+            # distinct titles, none of them is in the matcher cache
+            record('get_cat[rules={}]'.format(n_rules), lambda: [analytic.get_cat(t) for t in titles])
+            record('get_colors[rules={}]'.format(n_rules), analytic.get_colors, logfile)
+
+    rules = make_rules(1000)
+    for n_rows in sizes['rows']:
+        with workspace(rules, [today], n_rows):
+            analytic = fresh_analytics()
+            record('redo_cat[rows={}]'.format(n_rows), analytic.redo_cat, logfile)
+            record('analyze[rows={}]'.format(n_rows), analytic.analyze, logfile)
+            record('print_timeline[rows={}]'.format(n_rows), analytic.print_timeline, logfile)
+            record('print_pi_chart[rows={}]'.format(n_rows), analytic.print_pi_chart, logfile)
+
+    rules = make_rules(100)
+    for n_days in sizes['days']:
+        days = [today - datetime.timedelta(days=idx) for idx in range(n_days)][::-1]
+        with workspace(rules, days, 1000):
+            analytic = fresh_analytics()
+            analytic.redo_cat(logfile)
+            record('create_html[days={}]'.format(n_days), analytic.create_html)
+            record('create_html_cached[days={}]'.format(n_days), analytic.create_html)
+
+    # the main loop of script.py on a fake probe, no sleeping
+    start = datetime.datetime.combine(today, datetime.time(8)).timestamp()
+    trace = [(start + t, window, idle) for t, window, idle in make_trace(trace_hours * 3600)]
+    with workspace(make_rules(1000)):
+        fresh_analytics()
+        probe = ReplayProbe(trace, script.idle_time)
+        record('main_loop[changes={}]'.format(len(trace)), script.main, probe, 'replay', False)
+
+
+def write_results(path, results, scale):
+    report = {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'python': sys.version.split()[0],
+              'platform': sys.platform, 'scale': scale, 'results': results}
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=1, sort_keys=True)
+    print('results written to', path)
+
+
+def compare_results(path, results, threshold, scale, noise=0.005):
+    # names of the suite timings that got slower than baseline * (1 + threshold),
+    # differences below 'noise' seconds are timer jitter, not regressions.
+    # None if there is nothing to compare.
+    with open(path, 'r', encoding='utf-8') as file:
+        report = json.load(file)
+    baseline = report['results'].get('suite', {})
+    current = results.get('suite', {})
+    if report.get('scale', scale) != scale:
+        print('{} was run with --scale {}, this run with --scale {}, nothing compared'.format(
+            path, report['scale'], scale))
+        return None
+    names = sorted(set(baseline) & set(current))
+    if not names:
+        print('no suite timings in both {} and this run, nothing compared (run the suite benchmark)'.format(path))
+        return None
+    regressions = []
+    print('compared to {} (threshold {:.0%}):'.format(path, threshold))
+    for name in names:
+        ratio = current[name] / baseline[name] if baseline[name] > 0 else 1.0
+        flag = ''
+        if ratio > 1 + threshold and current[name] - baseline[name] > noise:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('  {:32s} {:9.4f} s -> {:9.4f} s  {:5.2f}x{}'.format(name, baseline[name], current[name], ratio, flag))
+    return regressions
+
+
+def bench_projects(n_titles=5000, n_rules=1000, project_counts=(10, 100)):
+    # category and project from one regex match against the category alone
+    rules = make_rules(n_rules)
+    titles = list(set(make_titles(n_titles, rules, n_unique=n_titles)))
+    matcher = CategoryMatcher(rules, rules[-1][1], cache_size=0)
+    t_cats, cats = timed(lambda: [matcher.match(t) for t in titles])
+    print('projects: {} distinct titles, {} category rules, no cache'.format(len(titles), n_rules))
+    print('  categories only          {:8.3f} s'.format(t_cats))
+    results = {'categories_s': t_cats}
+    for n_projects in project_counts:
+        projects = [('{}{:04d}'.format(pattern[:-4], idx), 'project {}'.format(idx % 7))
+                    for idx, (pattern, _) in enumerate(make_rules(n_projects, seed=5))]
+        both = CategoryMatcher(rules, rules[-1][1], cache_size=0, projects=projects)
+        t_both, classified = timed(lambda: [both.classify(t) for t in titles])
+        assert [cat for cat, _ in classified] == cats, 'projects changed the categories'
+        tagged = sum(1 for _, project in classified if project)
+        print('  with {:4d} project rules   {:8.3f} s  {:.2f}x, {} titles in a project'.format(
+            n_projects, t_both, t_both / t_cats, tagged))
+        results['projects_{}_s'.format(n_projects)] = t_both
+    return results
+
+
+def bench_live_server(n_clients=200, n_events=50, gap=0.02, n_pollers=20, n_requests=100):
+    # many local pages on the live dashboard: push latency of the events to all
+    # open event streams, and json requests of pages loading meanwhile
+    import socket
+    import selectors
+    import threading
+    import http.client
+    import numpy as np
+    from live_aggregate import DayAggregate
+    from live_server import LiveServer
+    rules = make_rules(50)
+    today = datetime.date.today()
+    days = [today - datetime.timedelta(days=idx) for idx in range(1, 31)]
+    with workspace(rules, days, 200):
+        live = DayAggregate()
+        server = LiveServer(live, 0)
+        server.start()
+        port = server.server_address[1]
+        selector = selectors.DefaultSelector()
+        for _ in range(n_clients):
+            client = socket.create_connection(('127.0.0.1', port))
+            client.sendall(b'GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            selector.register(client, selectors.EVENT_READ, bytearray())
+        arrivals = {} # event id -> receive times
+        done = threading.Event()
+
+        def read_streams():
+            while not done.is_set():
+                for key, _ in selector.select(0.1):
+                    chunk = key.fileobj.recv(65536)
+                    now = time.perf_counter()
+                    for event_id in re.findall(rb'^id: (\d+)$', chunk, re.M):
+                        arrivals.setdefault(int(event_id), []).append(now)
+        reader = threading.Thread(target=read_streams)
+        reader.start()
+        time.sleep(0.5)
+
+        def poll_api():
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            for idx in range(n_requests):
+                connection.request('GET', '/api/today' if idx % 2 else '/api/days')
+                connection.getresponse().read()
+            connection.close()
+        pollers = [threading.Thread(target=poll_api) for _ in range(n_pollers)]
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        for thread in pollers:
+            thread.start()
+        published = {}
+        for idx in range(n_events):
+            end = time.time()
+            live.add(end, rules[idx % len(rules)][1], 30, 'window {}'.format(idx))
+            published[idx + 1] = time.perf_counter()
+            server.publish(end, rules[idx % len(rules)][1], 30)
+            time.sleep(gap)
+        for thread in pollers:
+            thread.join()
+        time.sleep(0.5)
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        done.set()
+        reader.join()
+        server.stop()
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+    latency = np.array([arrival - published[event_id] for event_id, times in arrivals.items()
+                        for arrival in times]) * 1000
+    delivered = len(latency)
+    print('live server: {} event streams, {} events, {} pages polling {} json requests each'.format(
+        n_clients, n_events, n_pollers, n_requests))
+    print('  events delivered {} of {}, push latency p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'.format(
+        delivered, n_clients * n_events, np.percentile(latency, 50), np.percentile(latency, 99), latency.max()))
+    print('  {} json requests in {:.2f} s, cpu {:.2f} s for the whole process (server and clients)'.format(
+        n_pollers * n_requests, elapsed, cpu))
+    return {'delivered': delivered, 'latency_p50_ms': float(np.percentile(latency, 50)),
+            'latency_p99_ms': float(np.percentile(latency, 99)), 'cpu_s': cpu, 'elapsed_s': elapsed}
+
+
+BENCHMARKS = {
+    'get_cat': bench_get_cat,
+    'projects': bench_projects,
+    'timeline': bench_timeline,
+    'charts': bench_charts,
+    'writer': bench_writer,
+    'sampler': bench_sampler,
+    'replay': bench_replay,
+    'binlog': bench_binlog,
+    'redo_cat': bench_redo_cat,
+    'title_dict': bench_title_dict,
+    'archive': bench_archive,
+    'config': bench_config,
+    'inspiration': bench_inspiration,
+    'dashboard': bench_dashboard,
+    'summarize': bench_summarize,
+    'titles': bench_titles,
+    'live_server': bench_live_server,
+    'suite': bench_suite,
+}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='benchmarks of the recorder and analytics hot paths')
+    parser.add_argument('names', nargs='*', help='benchmarks to run, all by default: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small', help='sizes of the suite benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of the suite, the best one counts')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='results file of an earlier run to check the suite against')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown against --compare before the run fails, 0.25 = 25%%')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.names or BENCHMARKS:
+        if name == 'suite':
+            results[name] = bench_suite(args.scale, args.repeat)
+        else:
+            results[name] = BENCHMARKS[name]()
+    if args.json:
+        write_results(args.json, results, args.scale)
+    if args.compare:
+        regressions = compare_results(args.compare, results, args.threshold, args.scale)
+        if regressions is None:
+            return 1
+        if regressions:
+            print('{} regression(s): {}'.format(len(regressions), ', '.join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
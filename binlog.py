@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary copy of the daily logs.
+
+Every day log 'data/2018-08-15.csv' gets two files in 'data/bin':
+    2018-08-15.rec  fixed width numpy records (time, duration, category id, title id,
+                    project id) after a short header
+    2018-08-15.str  string table, one string per line, the ids index into it
+
+run 'python binlog.py' to convert all logs in 'data', add '--remove-csv' to
+delete the converted csv files of past days afterwards. Analytics reads the
+binary copy whenever it is at least as new as the csv.
+"""
+import os
+import sys
+import datetime
+import numpy as np
+import pandas as pd
+
+RECORD = np.dtype([('time', '<f8'), ('duration', '<i4'), ('category', '<i4'), ('title', '<i4'),
+                   ('project', '<i4')])
+REC_HEADER = b'WRREC\x00\x02\x00'
+# .rec files without the header are from before the project column
+RECORD_V1 = np.dtype([('time', '<f8'), ('duration', '<i4'), ('category', '<i4'), ('title', '<i4')])
+LOG_COLUMNS = ['time', 'category', 'duration', 'title', 'timestamp', 'project']
+
+
+def bin_paths(csv_path):
+    folder, filename = os.path.split(csv_path)
+    stem = os.path.join(folder, 'bin', os.path.splitext(filename)[0])
+    return stem + '.rec', stem + '.str'
+
+
+def list_days(folder='data'):
+    # csv style names of all days that have a binary copy
+    bin_folder = os.path.join(folder, 'bin')
+    if not os.path.isdir(bin_folder):
+        return []
+    return [name[:-4] + '.csv' for name in os.listdir(bin_folder) if name.endswith('.rec')]
+
+
+def read_csv(csv_path):
+    # the strings as categoricals, like the binary copy: a day repeats the same
+    # few dozen titles, comparisons and grouping then work on integer codes
+    return pd.read_csv(csv_path, encoding="ISO-8859-1", names=LOG_COLUMNS, sep=',',
+                       dtype={'category': 'category', 'title': 'category', 'project': 'category'})
+
+
+def encode(df):
+    # (records, string table) of a parsed day log
+    time = pd.to_numeric(df.time, errors='coerce')
+    df = df.loc[time.notna()]
+    project = df.project if 'project' in df else pd.Series('', index=df.index)
+    strings = pd.concat([df.category, df.title, project]).fillna('').astype(str)
+    strings = strings.str.replace('\n', ' ').str.replace('\r', ' ')
+    codes, uniques = pd.factorize(strings)
+    records = np.empty(len(df), dtype=RECORD)
+    records['time'] = time.loc[df.index].values
+    records['duration'] = pd.to_numeric(df.duration, errors='coerce').fillna(0).values
+    records['category'] = codes[:len(df)]
+    records['title'] = codes[len(df):2 * len(df)]
+    records['project'] = codes[2 * len(df):]
+    return records, list(uniques)
+
+
+def write_day(df, csv_path):
+    rec_path, str_path = bin_paths(csv_path)
+    os.makedirs(os.path.dirname(rec_path), exist_ok=True)
+    _write_files(rec_path, str_path, *encode(df))
+
+
+def _write_files(rec_path, str_path, records, strings):
+    # strings first: a reader that sees the records always finds their strings
+    with open(str_path, 'w', encoding='utf-8', newline='\n') as file:
+        file.write('\n'.join(strings))
+    with open(rec_path, 'wb') as file:
+        file.write(REC_HEADER)
+        records.tofile(file)
+
+
+def read_records(csv_path):
+    # (records, string table) of the binary copy of a day
+    rec_path, str_path = bin_paths(csv_path)
+    with open(rec_path, 'rb') as file:
+        if file.read(len(REC_HEADER)) == REC_HEADER:
+            records = np.fromfile(file, dtype=RECORD)
+        else:
+            file.seek(0)
+            records = np.fromfile(file, dtype=RECORD_V1)
+    with open(str_path, 'r', encoding='utf-8', newline='\n') as file:
+        strings = file.read().split('\n')
+    return records, strings
+
+
+def frame(records, strings):
+    # the day log of the records, the strings as categoricals
+    project = np.nan
+    if 'project' in records.dtype.names:
+        project = pd.Categorical.from_codes(records['project'], categories=strings)
+    return pd.DataFrame({
+        'time': records['time'],
+        'category': pd.Categorical.from_codes(records['category'], categories=strings),
+        'duration': records['duration'],
+        'title': pd.Categorical.from_codes(records['title'], categories=strings),
+        'timestamp': np.nan,
+        'project': project,
+    })
+
+
+def read_day(csv_path):
+    return frame(*read_records(csv_path))
+
+
+def upgrade(records, strings):
+    # records from before the project column get an empty project
+    if 'project' in records.dtype.names:
+        return records, strings
+    upgraded = np.zeros(len(records), dtype=RECORD)
+    for name in RECORD_V1.names:
+        upgraded[name] = records[name]
+    if '' not in strings:
+        strings = strings + ['']
+    upgraded['project'] = strings.index('')
+    return upgraded, strings
+
+
+def reclassify_records(records, strings, classify):
+    # new category and project of every row, classify(title) -> (category,
+    # project) runs once per distinct title and the rows only get the ids.
+    # Returns the new records and strings and [(title, old category, new
+    # category, old project, new project, rows)] of the titles whose rows change.
+    records, strings = upgrade(records, list(strings))
+    index = {string: idx for idx, string in enumerate(strings)}
+
+    def string_id(string):
+        if string not in index:
+            index[string] = len(strings)
+            strings.append(string)
+        return index[string]
+
+    titles, inverse = np.unique(records['title'], return_inverse=True)
+    categories = np.empty(len(titles), dtype='<i4')
+    projects = np.empty(len(titles), dtype='<i4')
+    for pos, title in enumerate(titles):
+        category, project = classify(strings[title])
+        categories[pos] = string_id(category)
+        projects[pos] = string_id(project)
+    category = categories[inverse]
+    project = projects[inverse]
+    changed = (records['category'] != category) | (records['project'] != project)
+    # one entry per title and old category and project
+    old = np.stack([records['title'][changed], records['category'][changed], records['project'][changed],
+                    category[changed], project[changed]])
+    combos, rows = np.unique(old, axis=1, return_counts=True)
+    changes = [(strings[title], strings[old_cat], strings[new_cat], strings[old_proj], strings[new_proj], int(n))
+               for (title, old_cat, old_proj, new_cat, new_proj), n in zip(combos.T, rows)]
+    records = records.copy()
+    records['category'] = category
+    records['project'] = project
+    return records, strings, changes
+
+
+def reclassify(csv_path, classify, dry_run=False):
+    # reclassify_records on the binary copy of a day, written back unless dry_run
+    records, strings, changes = reclassify_records(*read_records(csv_path), classify)
+    if changes and not dry_run:
+        _write_files(*bin_paths(csv_path), records, strings)
+    return changes
+
+
+def newer_binary(csv_path):
+    # path of the binary records if they can stand in for the csv, else None
+    rec_path, _ = bin_paths(csv_path)
+    try:
+        rec_mtime = os.stat(rec_path).st_mtime_ns
+    except OSError:
+        return None
+    try:
+        if os.stat(csv_path).st_mtime_ns > rec_mtime:
+            return None
+    except OSError:
+        pass
+    return rec_path
+
+
+def convert(folder='data', remove_csv=False):
+    today = datetime.date.today()
+    converted = 0
+    for log in sorted(os.listdir(folder)):
+        if not log.endswith('.csv'):
+            continue
+        csv_path = os.path.join(folder, log)
+        if newer_binary(csv_path) is None:
+            write_day(read_csv(csv_path), csv_path)
+            converted += 1
+        # today's log is still being written by script.py
+        if remove_csv and log[:10] != '{:%Y-%m-%d}'.format(today):
+            os.remove(csv_path)
+    print('{} logs converted to {}'.format(converted, os.path.join(folder, 'bin')))
+    return converted
+
+
+if __name__ == '__main__':
+    convert('data', remove_csv='--remove-csv' in sys.argv[1:])
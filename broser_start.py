@@ -1,11 +1,10 @@
 import os
 import random
 from PIL import Image
-import base64
-from io import BytesIO
 import markdown2
 from datetime import datetime
 import re
+import json
 
 # Specify the folder containing your images
 #image_folder = r"C:\Users\cr3881\OneDrive - Zebra Technologies\window_recorder\figs\tabs"
@@ -14,10 +13,115 @@ import re
 #md_file_path = r"C:\Users\cr3881\OneDrive - Zebra Technologies\logseq-notes\journals\2024-07-05.md"
 #md_folder = r"C:\Users\cr3881\OneDrive - Zebra Technologies\logseq-notes\journals"
 
+# downscaled copies of the pictures, sized for the screen
+thumb_folder = 'figs/thumbs'
+screen_size = (1920, 1080)
+
+_image_lists = {} # folder -> (mtime of the folder, image files)
+
+def list_images(image_folder):
+    # the folder is only listed again when its mtime changes
+    mtime = os.stat(image_folder).st_mtime_ns
+    cached = _image_lists.get(image_folder)
+    if cached is None or cached[0] != mtime:
+        image_files = [f for f in os.listdir(image_folder) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))]
+        _image_lists[image_folder] = (mtime, image_files)
+    return _image_lists[image_folder][1]
+
+def get_thumbnail(image_path, folder=None, size=None):
+    # path of the downscaled copy of image_path, it is made on first use and
+    # made again when the picture changes (the mtime is part of the name)
+    folder = folder or thumb_folder
+    size = size or screen_size
+    stem, ext = os.path.splitext(os.path.basename(image_path))
+    mtime = os.stat(image_path).st_mtime_ns
+    thumb_path = os.path.join(folder, '{}.{}{}'.format(stem, mtime, ext.lower()))
+    if os.path.isfile(thumb_path):
+        return thumb_path
+
+    os.makedirs(folder, exist_ok=True)
+    for old in os.listdir(folder):
+        if old.startswith(stem + '.') and old.endswith(ext.lower()) and old[len(stem) + 1:-len(ext)].isdigit():
+            os.remove(os.path.join(folder, old))
+    tmp_path = thumb_path + '.tmp'
+    with Image.open(image_path) as img:
+        img.thumbnail(size)
+        if ext.lower() in ('.jpg', '.jpeg'):
+            img.convert('RGB').save(tmp_path, format='JPEG', quality=85)
+        else:
+            img.save(tmp_path, format=img.format or 'PNG')
+    os.replace(tmp_path, thumb_path)
+    return thumb_path
+
+# date of every journal file in md_folder, kept between runs
+journal_index_path = 'figs/journal_index.json'
+
+_rendered_md = {} # path -> (mtime, html)
+
+def parse_date(filename):
+    # Remove .md extension
+    name = os.path.splitext(filename)[0]
+    # Try to parse the date
+    try:
+        return datetime.strptime(name, '%Y-%m-%d')
+    except ValueError:
+        try:
+            return datetime.strptime(name, '%Y_%m_%d')
+        except ValueError:
+            return None
+
+def _load_journal_index(folder):
+    try:
+        with open(journal_index_path, 'r', encoding='utf-8') as file:
+            index = json.load(file)
+        if index.get('folder') == folder:
+            return index
+    except (OSError, ValueError):
+        pass
+    return {'folder': folder, 'mtime': None, 'files': {}}
+
+def get_latest_md_file(folder):
+    # the folder is only listed when its mtime changed since the last call, and
+    # only file names not seen before have their date parsed
+    index = _load_journal_index(folder)
+    mtime = os.stat(folder).st_mtime_ns
+    if index['mtime'] != mtime:
+        md_files = [f for f in os.listdir(folder) if f.endswith('.md')]
+        known = index['files']
+        files = {}
+        for file in md_files:
+            if file in known:
+                files[file] = known[file]
+            else:
+                date = parse_date(file)
+                files[file] = date.strftime('%Y-%m-%d') if date else None
+        index['files'] = files
+        index['mtime'] = mtime
+        os.makedirs(os.path.dirname(journal_index_path), exist_ok=True)
+        with open(journal_index_path, 'w', encoding='utf-8') as file:
+            json.dump(index, file)
+
+    valid_files = [(file, date) for file, date in index['files'].items() if date]
+    if not valid_files:
+        return None
+
+    latest_file = max(valid_files, key=lambda x: x[1])
+    return os.path.join(folder, latest_file[0])
+
+def render_markdown(md_file_path):
+    # a journal is only converted again when it changed
+    mtime = os.stat(md_file_path).st_mtime_ns
+    cached = _rendered_md.get(md_file_path)
+    if cached is None or cached[0] != mtime:
+        with open(md_file_path, 'r', encoding='utf-8') as md_file:
+            cached = (mtime, markdown2.markdown(md_file.read()))
+        _rendered_md[md_file_path] = cached
+    return cached[1]
+
 def generate_inspirational_html(image_folder, md_folder, output_file="inspirational_image.html"):
 
     # Get a list of all image files in the folder
-    image_files = [f for f in os.listdir(image_folder) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))]
+    image_files = list_images(image_folder)
 
     # Select a random image
     if image_files:
@@ -27,11 +131,9 @@ def generate_inspirational_html(image_folder, md_folder, output_file="inspiratio
         print("No image files found in the specified folder.")
         exit()
 
-    # Open the image and convert it to base64
-    with Image.open(image_path) as img:
-        buffered = BytesIO()
-        img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+    # reference a screen sized copy instead of inlining the full picture
+    thumb_path = get_thumbnail(image_path)
+    img_src = os.path.relpath(thumb_path, os.path.dirname(os.path.abspath(output_file))).replace(os.sep, '/')
 
     # Todo list and inspirational words
     todo_list = [
@@ -39,35 +141,6 @@ def generate_inspirational_html(image_folder, md_folder, output_file="inspiratio
         "2. Work on a personal project"
     ]
 
-    def get_latest_md_file(folder):
-        def parse_date(filename):
-            # Remove .md extension
-            name = os.path.splitext(filename)[0]
-            # Try to parse the date
-            try:
-                return datetime.strptime(name, '%Y-%m-%d')
-            except ValueError:
-                try:
-                    return datetime.strptime(name, '%Y_%m_%d')
-                except ValueError:
-                    return None
-
-        md_files = [f for f in os.listdir(folder) if f.endswith('.md')]
-        valid_files = []
-
-        for file in md_files:
-            date = parse_date(file)
-            if date:
-                valid_files.append((file, date))
-
-        if not valid_files:
-            return None
-
-        latest_file = max(valid_files, key=lambda x: x[1])
-        return os.path.join(folder, latest_file[0])
-
-
-
     # Get the path of the latest .md file
     md_file_path = get_latest_md_file(md_folder)
     print(md_file_path)
@@ -76,9 +149,7 @@ def generate_inspirational_html(image_folder, md_folder, output_file="inspiratio
         exit()
     # Read the content of the .md file
     try:
-        with open(md_file_path, 'r', encoding='utf-8') as md_file:
-            md_content = md_file.read()
-            md_content = markdown2.markdown(md_content)
+        md_content = render_markdown(md_file_path)
     except FileNotFoundError:
         print(f"The file {md_file_path} was not found.")
         exit()
@@ -168,7 +239,7 @@ def generate_inspirational_html(image_folder, md_folder, output_file="inspiratio
     </head>
     <body>
         <div class="container">
-            <img src="data:image/png;base64,{img_str}" alt="Inspirational Image" class="image">
+            <img src="{img_src}" alt="Inspirational Image" class="image">
             <div class="overlay">
                 <h2>Today's Todo List</h2>
                 <ul>
@@ -183,10 +254,10 @@ def generate_inspirational_html(image_folder, md_folder, output_file="inspiratio
     """
 
     # Write the HTML content to a file
-    with open("inspirational_image.html", "w") as f:
+    with open(output_file, "w") as f:
         f.write(html_content)
 
-    print("HTML file 'inspirational_image.html' has been generated successfully.")
+    print(f"HTML file '{output_file}' has been generated successfully.")
 
 
 # This allows the script to be run as a standalone program
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Category matcher built once from the CATEGORIES section of config.dat.
+
+All rules are compiled into a single regex so a window title is classified
+with one call into the regex engine instead of one re.search per rule.
+The rules of the PROJECTS section go into the same regex, so the category
+and the project of a title come out of the same match. Rules with global
+flags like '(?i)', backreferences or named groups only work on their own,
+they are searched one by one and win if they come first in the config.
+"""
+import re
+from functools import lru_cache
+
+# parts of a pattern that change their meaning or fail inside the combined regex
+_SEPARATE = re.compile(r'\(\?[aiLmsux]+\)|\\[1-9]|\(\?P[=<]|\(\?\(')
+
+
+class CategoryMatcher():
+
+    def __init__(self, rules, default='not categorized', cache_size=4096, projects=(), project_default=''):
+        # rules, projects: lists of (pattern, name) in priority order (first match wins)
+        self.default = default
+        self.project_default = project_default
+        self.rules = self._valid(rules)
+        self.projects = self._valid(projects)
+        # {'r' or 'p': [(rule index, compiled pattern)]} of the rules searched on their own
+        self.separate = {'r': [], 'p': []}
+        # every alternative is an anchored lookahead, so the engine tries the
+        # rules strictly in config order and the first one that is found
+        # anywhere in the title wins - the same as the old loop. Both
+        # alternations are optional and zero width, the project rules are
+        # tried right after the category rules at the same position.
+        parts = []
+        for prefix, rules in [('r', self.rules), ('p', self.projects)]:
+            alternatives = []
+            for idx, (pattern, _) in enumerate(rules):
+                if _SEPARATE.search(pattern):
+                    self.separate[prefix].append((idx, re.compile(pattern)))
+                else:
+                    alternatives.append('(?P<{}{}>(?=[\\s\\S]*?(?:{})))'.format(prefix, idx, pattern))
+            if alternatives:
+                # an empty last alternative instead of '?', which is a lot slower in re
+                parts.append('(?:{}|)'.format('|'.join(alternatives)))
+
+        self.regex = None
+        if parts:
+            try:
+                self.regex = re.compile(''.join(parts))
+            except re.error as e:
+                # some pattern does not fit into the combined regex after all
+                print('category rules are searched one by one:', e)
+                self.separate = {prefix: [(idx, re.compile(pattern)) for idx, (pattern, _) in enumerate(rules)]
+                                 for prefix, rules in [('r', self.rules), ('p', self.projects)]}
+        if self.regex is not None:
+            # group number -> ('r' or 'p', rule index), user patterns may
+            # bring groups of their own
+            self.groups = {number: (name[0], int(name[1:])) for name, number in self.regex.groupindex.items()
+                           if name[0] in 'rp' and name[1:].isdigit()}
+            self.first_project_group = min([number for number, (kind, _) in self.groups.items() if kind == 'p'],
+                                           default=None)
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+
+    def _valid(self, rules):
+        valid = []
+        for pattern, name in rules:
+            try:
+                re.compile(pattern)
+            except (re.error, TypeError) as e:
+                print('invalid category pattern {!r} skipped: {}'.format(pattern, e))
+                continue
+            valid.append((pattern, name))
+        return valid
+
+    def _classify(self, window):
+        # (category, project) of a window title
+        category = self.default
+        project = self.project_default
+        rule = project_rule = None
+        if self.regex is not None:
+            # the winning rule groups capture '' (zero width), the others None
+            groups = self.regex.match(window).groups()
+            rule = self._find(groups, 'r', 0)
+            if self.first_project_group is not None:
+                project_rule = self._find(groups, 'p', self.first_project_group - 1)
+        rule = self._search(self.separate['r'], window, rule)
+        project_rule = self._search(self.separate['p'], window, project_rule)
+        if rule is not None:
+            category = self.rules[rule][1]
+        if project_rule is not None:
+            project = self.projects[project_rule][1]
+        return category, project
+
+    def _search(self, separate, window, found):
+        # a rule searched on its own wins if it comes before the rule found
+        # by the combined regex
+        for idx, regex in separate:
+            if found is not None and idx > found:
+                break
+            if regex.search(window):
+                return idx
+        return found
+
+    def _find(self, groups, kind, start):
+        # index of the first rule of this kind that matched, the search for ''
+        # runs in C, groups of the user patterns that are empty are skipped
+        while True:
+            try:
+                idx = groups.index('', start)
+            except ValueError:
+                return None
+            found = self.groups.get(idx + 1)
+            if found is not None:
+                return found[1] if found[0] == kind else None
+            start = idx + 1
+
+    def match(self, window):
+        return self.classify(window)[0]
+
+    def project(self, window):
+        return self.classify(window)[1]
+
+    def cache_info(self):
+        return self.classify.cache_info()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Buffered writer for the daily event logs in 'data'.
+
+Keeps the file of the current day open, collects rows in memory and writes
+them out when max_rows are buffered or the oldest buffered row is older
+than max_delay seconds. max_delay is the most recording time that can be
+lost on a crash. A new file is started when the day changes.
+
+While a day log is open its lock file '2018-08-13.csv.lock' is locked (flock,
+msvcrt.locking on windows), log_in_use tells redo_cat and archive.py to leave
+a log alone that the recorder still writes.
+"""
+import os
+import csv
+import time
+import datetime
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock(fd, blocking=True):
+    # exclusive lock on the first byte of a lock file, OSError if it is taken
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+
+
+def _unlock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def log_in_use(path):
+    # True while a running recorder has this day log open
+    try:
+        fd = os.open(path + '.lock', os.O_RDWR)
+    except OSError:
+        return False
+    try:
+        _lock(fd, blocking=False)
+    except OSError:
+        return True
+    else:
+        _unlock(fd)
+        return False
+    finally:
+        os.close(fd)
+
+
+class EventWriter():
+
+    def __init__(self, folder='data', max_rows=100, max_delay=30.0, clock=time.time):
+        self.folder = folder
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.clock = clock
+        self.buffer = []
+        self.buffered_since = None
+        self.day = None
+        self.file = None
+        self.writer = None
+        self.lock_fd = None
+        self.rows_written = 0
+
+    def path(self, day):
+        filename = '{0:d}-{1:02d}-{2:02d}.csv'.format(day.year, day.month, day.day)
+        return os.path.join(self.folder, filename)
+
+    def write(self, data):
+        now = self.clock()
+        day = datetime.date.fromtimestamp(now)
+        if day != self.day:
+            # midnight: everything buffered so far belongs to the old file
+            self.flush()
+            self._open(day)
+        if not self.buffer:
+            self.buffered_since = now
+        self.buffer.append(data)
+        if len(self.buffer) >= self.max_rows:
+            self.flush()
+        else:
+            self.poll(now)
+
+    def poll(self, now=None):
+        # call regularly, flushes once the oldest buffered row is max_delay old
+        if self.buffer:
+            if now is None:
+                now = self.clock()
+            if now - self.buffered_since >= self.max_delay:
+                self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        self.writer.writerows(self.buffer)
+        self.file.flush()
+        self.rows_written += len(self.buffer)
+        self.buffer = []
+        self.buffered_since = None
+
+    def close(self):
+        self.flush()
+        self._close_file()
+        self.day = None
+
+    def _close_file(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.lock_fd is not None:
+            _unlock(self.lock_fd)
+            os.close(self.lock_fd)
+            self.lock_fd = None
+            try:
+                os.remove(self.path(self.day) + '.lock')
+            except OSError:
+                # windows, someone is just looking at it
+                pass
+
+    def _open(self, day):
+        self._close_file()
+        if not os.path.isdir(self.folder):
+            os.mkdir(self.folder)
+        # the lock is held until the file is closed, also when the process dies
+        self.lock_fd = os.open(self.path(day) + '.lock', os.O_RDWR | os.O_CREAT)
+        _lock(self.lock_fd)
+        self.file = open(self.path(day), 'a')
+        self.writer = csv.writer(self.file, delimiter=',', lineterminator="\r")
+        self.day = day
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Running totals of the day that script.py is recording.
+
+DayAggregate keeps seconds per category, per project and per window title
+and a list of timeline segments, updated with every recorded event. Analytics uses it for today's table row,
+review and charts instead of reading the day log again. It is checkpointed
+to a json file so a restart of script.py can pick up where it stopped, with
+the size and the last bytes of the day log it covers, the rows written after
+it are read from the log.
+"""
+import os
+import json
+import datetime
+import threading
+import pandas as pd
+from title_index import normalize_title
+
+
+class DayAggregate():
+
+    def __init__(self, day=None):
+        self.lock = threading.Lock()
+        self.day = day or datetime.date.today()
+        self.totals = {}
+        # [start, end, category, seconds], neighbours of one category are merged
+        self.segments = []
+        self.titles = {} # normalized title -> {category: seconds}, without idle
+        self.projects = {} # project -> seconds, without idle
+        self.events = 0
+        self.log = None # [size, last bytes] of the day log at the checkpoint
+        self._frame = None
+
+    def logfile(self):
+        return '{0:d}-{1:02d}-{2:02d}.csv'.format(self.day.year, self.day.month, self.day.day)
+
+    def add(self, end, category, duration, title=None, project=None):
+        day = datetime.date.fromtimestamp(end)
+        with self.lock:
+            if day != self.day:
+                self._reset(day)
+            self.totals[category] = self.totals.get(category, 0) + duration
+            if title is not None and category != 'idle':
+                per_cat = self.titles.setdefault(normalize_title(title), {})
+                per_cat[category] = per_cat.get(category, 0) + duration
+            if project and category != 'idle':
+                self.projects[project] = self.projects.get(project, 0) + duration
+            start = end - duration
+            last = self.segments[-1] if self.segments else None
+            if last is not None and last[2] == category and start <= last[1] + 1:
+                last[1] = end
+                last[3] += duration
+            else:
+                self.segments.append([start, end, category, duration])
+            self.events += 1
+            self._frame = None
+
+    def add_frame(self, df):
+        # catch up with events that are only in the day log, e.g. after a crash
+        time = pd.to_numeric(df.time, errors='coerce')
+        duration = pd.to_numeric(df.duration, errors='coerce')
+        projects = df.project if 'project' in df else [None] * len(df)
+        for end, category, dur, title, project in zip(time, df.category, duration, df.title, projects):
+            if end == end and dur == dur:
+                self.add(float(end), category, int(dur), title if isinstance(title, str) else None,
+                         project if isinstance(project, str) else None)
+
+    def _reset(self, day):
+        self.day = day
+        self.totals = {}
+        self.segments = []
+        self.titles = {}
+        self.projects = {}
+        self.events = 0
+        self._frame = None
+
+    def get_totals(self):
+        with self.lock:
+            return dict(self.totals)
+
+    def get_projects(self):
+        with self.lock:
+            return dict(self.projects)
+
+    def title_rows(self):
+        # [(title, category, seconds)] of the day so far
+        with self.lock:
+            return [(title, category, seconds) for title, per_cat in self.titles.items()
+                    for category, seconds in per_cat.items()]
+
+    def frame(self):
+        # the segments in the column layout of a day log, one row per segment
+        with self.lock:
+            if self._frame is None:
+                self._frame = pd.DataFrame({
+                    'time': [segment[1] for segment in self.segments],
+                    'category': [segment[2] for segment in self.segments],
+                    'duration': [segment[3] for segment in self.segments],
+                    'title': None,
+                    'timestamp': None,
+                })
+            return self._frame
+
+    def checkpoint(self, path, log_path=None):
+        # log_path: the flushed day log, every row of it is in the aggregate
+        log = None
+        if log_path is not None and os.path.isfile(log_path):
+            with open(log_path, 'rb') as file:
+                size = file.seek(0, os.SEEK_END)
+                file.seek(max(size - 64, 0))
+                log = [size, file.read().decode('latin-1')]
+        with self.lock:
+            state = {'day': self.day.isoformat(), 'totals': self.totals,
+                     'segments': self.segments, 'titles': self.titles,
+                     'projects': self.projects, 'events': self.events, 'log': log}
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(state, file)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def restore(cls, path, day=None):
+        # the checkpoint of the same day, or an empty aggregate
+        aggregate = cls(day)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return aggregate
+        if state.get('day') != aggregate.day.isoformat():
+            return aggregate
+        aggregate.totals = state['totals']
+        aggregate.segments = state['segments']
+        aggregate.titles = state.get('titles', {})
+        aggregate.projects = state.get('projects', {})
+        aggregate.events = state['events']
+        aggregate.log = state.get('log')
+        return aggregate
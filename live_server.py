@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Optional local dashboard server for the day script.py is recording.
+
+Serves the seconds per day and category as json from memory and pushes
+every recorded event to the open pages as server-sent events, so the page
+follows the recording within a second without a file being rewritten.
+
+    GET /            the live page
+    GET /api/today   today's seconds per category and project
+    GET /api/days    seconds per day and category, ?start=2018-08-01&end=2018-08-31
+    GET /events      text/event-stream, one 'data: {...}' per recorded event
+
+switched on with 'server_port = 8765' in [SETTINGS] or 'python script.py --serve 8765',
+it only listens on 127.0.0.1.
+"""
+import os
+import json
+import datetime
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from analytics import Analytics
+
+
+class EventHub():
+    # the last 'keep' events, each encoded once for all clients. Every event
+    # carries the totals of the day, a client that missed some is right again
+    # with the next one.
+
+    def __init__(self, keep=256):
+        self.condition = threading.Condition()
+        self.events = deque(maxlen=keep) # (id, encoded event)
+        self.last_id = 0
+        self.closed = False
+
+    def publish(self, message):
+        data = json.dumps(message)
+        with self.condition:
+            self.last_id += 1
+            self.events.append((self.last_id, 'id: {}\ndata: {}\n\n'.format(self.last_id, data).encode('utf-8')))
+            self.condition.notify_all()
+
+    def wait(self, after, timeout):
+        # (encoded events with an id above 'after', id of the last one), no
+        # events when nothing happened within timeout seconds
+        with self.condition:
+            self.condition.wait_for(lambda: self.last_id > after or self.closed, timeout)
+            missed = min(self.last_id - after, len(self.events))
+            chunks = [self.events[idx][1] for idx in range(len(self.events) - missed, len(self.events))]
+            return chunks, self.last_id
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class LiveServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    # many pages may connect at once, the default backlog of 5 drops connections
+    request_queue_size = 128
+
+    def __init__(self, live, port=8765, host='127.0.0.1', heartbeat=15):
+        super().__init__((host, port), LiveHandler)
+        self.live = live
+        self.hub = EventHub()
+        self.heartbeat = heartbeat # seconds between two keep alive comments on /events
+        # Analytics is not thread safe, the request threads take turns
+        self.lock = threading.Lock()
+        self.analytic = Analytics()
+        self.analytic.live = live
+        self.past = {} # logfile -> (stat key, seconds per category) of past days
+        with open('html/head.txt', 'r', encoding='utf-8') as file:
+            head = file.read()
+        with open('html/tail.txt', 'r', encoding='utf-8') as file:
+            tail = file.read()
+        self.page = (head + _LIVE_PAGE + tail).encode('utf-8')
+        self.thread = None
+
+    def url(self):
+        return 'http://{}:{}/'.format(*self.server_address[:2])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='live server', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.hub.close()
+        self.shutdown()
+        self.server_close()
+
+    def publish(self, end, category, duration, project=''):
+        # call after the event went into the live aggregate
+        self.hub.publish({'day': self.live.day.isoformat(), 'time': end, 'category': category,
+                          'duration': duration, 'project': project,
+                          'totals': self.live.get_totals(), 'projects': self.live.get_projects()})
+
+    def _categories(self):
+        self.analytic.reload_config()
+        categories = self.analytic.get_unique_categories()
+        colors = dict(self.analytic.color_list)
+        return categories, [colors.get(cat, '') for cat in categories]
+
+    def today(self):
+        with self.lock:
+            categories, colors = self._categories()
+        return {'day': self.live.day.isoformat(), 'categories': categories, 'colors': colors,
+                'totals': self.live.get_totals(), 'projects': self.live.get_projects(),
+                'events': self.live.events}
+
+    def days(self, start=None, end=None):
+        # past days come from memory, only days that are new or whose log
+        # changed are asked from the summary store
+        end = end or self.live.day.isoformat()
+        start = start or (datetime.date.fromisoformat(end) - datetime.timedelta(days=30)).isoformat()
+        with self.lock:
+            categories, colors = self._categories()
+            logs = [log for log in self.analytic.get_log_list()[0] if start <= log[:10] <= end]
+            keys = {}
+            for log in logs:
+                if log != self.live.logfile():
+                    stat = self.analytic._log_stat(os.path.join(self.analytic.path_data, log))
+                    keys[log] = (stat.st_size, stat.st_mtime_ns)
+            changed = [log for log, key in keys.items() if self.past.get(log, (None,))[0] != key]
+            if changed:
+                for log, totals in self.analytic.get_day_totals(changed).items():
+                    self.past[log] = (keys[log], totals)
+        days = []
+        for log in reversed(logs):
+            totals = self.live.get_totals() if log == self.live.logfile() else self.past[log][1]
+            days.append({'day': log[:10], 'totals': totals})
+        return {'categories': categories, 'colors': colors, 'days': days}
+
+
+class LiveHandler(BaseHTTPRequestHandler):
+
+    # keep alive for the json requests of a page
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/':
+            self._send('text/html; charset=utf-8', self.server.page)
+        elif url.path == '/api/today':
+            self._send_json(self.server.today())
+        elif url.path == '/api/days':
+            query = parse_qs(url.query)
+            try:
+                for value in query.get('start', []) + query.get('end', []):
+                    datetime.date.fromisoformat(value)
+            except ValueError as e:
+                self._send('text/plain; charset=utf-8', str(e).encode('utf-8'), 400)
+                return
+            self._send_json(self.server.days(query.get('start', [None])[0], query.get('end', [None])[0]))
+        elif url.path == '/events':
+            self._events()
+        else:
+            self._send('text/plain; charset=utf-8', b'not found', 404)
+
+    def _send(self, content_type, body, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data):
+        self._send('application/json', json.dumps(data).encode('utf-8'))
+
+    def _events(self):
+        hub = self.server.hub
+        # a reconnecting page gets the events it missed, a new one only new events
+        try:
+            after = int(self.headers.get('Last-Event-ID'))
+        except (TypeError, ValueError):
+            after = hub.last_id
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            self.wfile.write(b'retry: 1000\n\n')
+            while not hub.closed:
+                chunks, after = hub.wait(after, self.server.heartbeat)
+                self.wfile.write(b''.join(chunks) or b': ping\n\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        # the recorder prints the events, not every request of the page
+        pass
+
+
+_LIVE_PAGE = """
+<p id="status">connecting ...</p>
+<table style="width:100%" id="table"></table>
+<script>
+var state = null;
+function hms(sec) {
+    var hr = Math.floor(sec / 3600), mn = Math.floor(sec % 3600 / 60), s = Math.floor(sec % 60);
+    return ('     ' + hr).slice(-6) + ':' + ('0' + mn).slice(-2) + ':' + ('0' + s).slice(-2);
+}
+function draw() {
+    var rows = '<tr><td></td>';
+    state.categories.forEach(function (cat, idx) {
+        rows += '<td style="background-color:' + state.colors[idx] + '"><b>' + cat + '</b></td>';
+    });
+    rows += '<td><b>Total Time</b></td></tr>';
+    state.days.forEach(function (day) {
+        var total = 0;
+        rows += '<tr><td><b>' + day.day + '</b></td>';
+        state.categories.forEach(function (cat, idx) {
+            var dur = day.totals[cat] || 0;
+            total += dur;
+            rows += '<td style="background-color:' + state.colors[idx] + '">' + hms(dur) + '</td>';
+        });
+        rows += '<td>' + hms(total) + '</td></tr>';
+    });
+    document.getElementById('table').innerHTML = rows;
+}
+function load() {
+    fetch('api/days').then(function (response) { return response.json(); }).then(function (days) {
+        state = days;
+        draw();
+    });
+}
+var source = new EventSource('events');
+source.onopen = function () {
+    document.getElementById('status').textContent = 'live';
+    load();
+};
+source.onerror = function () {
+    document.getElementById('status').textContent = 'reconnecting ...';
+};
+source.onmessage = function (message) {
+    var event = JSON.parse(message.data);
+    var time = new Date(event.time * 1000).toLocaleTimeString();
+    document.getElementById('status').textContent = 'live, ' + time + ' ' + event.category +
+        ' ' + hms(event.duration).trim() + (event.project ? ' (' + event.project + ')' : '');
+    if (state == null) return;
+    var last = state.days[state.days.length - 1];
+    if (last == null || last.day != event.day) {
+        // a new day or a new category, take everything from the server again
+        load();
+        return;
+    }
+    if (state.categories.indexOf(event.category) < 0) {
+        load();
+        return;
+    }
+    last.totals = event.totals;
+    draw();
+};
+</script>
+"""
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Timing of the recorder loop in script.py, to see when and by how much it stalls.
+
+LoopStats measures the time spent in the probe calls, in save_data, in the
+html refresh and the other steps of an iteration, and the actual period of
+the loop against the interval the sampler meant to sleep. The event sampler
+has no interval, there the loop is late by the time it takes from a sample
+coming in to the next wait. Histograms are
+kept over the last 'window' iterations and written to 'data/loop_stats.json'
+every dump_interval seconds.
+
+    python script.py --loop-stats   records with the timing switched on
+    python loop_stats.py            prints the last dump of a running script
+"""
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+import numpy as np
+
+# upper edges of the histogram buckets in ms, the last bucket is everything above
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class Timer():
+    # count, total and maximum of all calls, percentiles and histogram of the
+    # last 'window' ones
+
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+            self.recent.append(seconds)
+
+    def summary(self):
+        with self.lock:
+            recent = np.array(self.recent) * 1000
+            count, total, largest = self.count, self.total, self.max
+        summary = {'count': count, 'total_s': round(total, 3),
+                   'mean_ms': round(total * 1000 / count, 3) if count else None,
+                   'max_ms': round(largest * 1000, 3)}
+        if len(recent):
+            p50, p90, p99 = np.percentile(recent, [50, 90, 99])
+            summary.update({'p50_ms': round(p50, 3), 'p90_ms': round(p90, 3), 'p99_ms': round(p99, 3),
+                            'recent_max_ms': round(recent.max(), 3)})
+        counts = np.bincount(np.searchsorted(BUCKETS_MS, recent), minlength=len(BUCKETS_MS) + 1)
+        labels = ['<{}'.format(edge) for edge in BUCKETS_MS] + ['>={}'.format(BUCKETS_MS[-1])]
+        summary['histogram_ms'] = {label: int(n) for label, n in zip(labels, counts) if n}
+        return summary
+
+
+class LoopStats():
+
+    def __init__(self, path, dump_interval=60, window=10000, stall=0.1, intended=0.01,
+                 clock=time.perf_counter):
+        self.path = path
+        self.dump_interval = dump_interval
+        self.window = window
+        self.stall = stall # seconds the loop may be late before it counts as a stall
+        self.intended = intended # the period the loop is meant to run at
+        self.clock = clock
+        self.started = time.time()
+        self.timers = {}
+        self.period = Timer(window)
+        self.lateness = Timer(window)
+        self.stalls = deque(maxlen=50)
+        self.steps = {} # seconds per step in the current iteration
+        self.last_tick = None
+        self.sleep = None
+        self.sampled_at = None
+        self.next_dump = clock() + dump_interval
+
+    def timer(self, name):
+        if name not in self.timers:
+            self.timers[name] = Timer(self.window)
+        return self.timers[name]
+
+    def add(self, name, seconds, step=True):
+        self.timer(name).add(seconds)
+        if step:
+            self.steps[name] = self.steps.get(name, 0) + seconds
+
+    def wrap(self, name, func, step=True):
+        # func with its calls timed as 'name'
+        timer = self.timer(name)
+        clock = self.clock
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds = clock() - start
+                timer.add(seconds)
+                if step:
+                    self.steps[name] = self.steps.get(name, 0) + seconds
+        return timed
+
+    def sampled(self):
+        # call when the sampler returned a sample
+        self.sampled_at = self.clock()
+
+    def tick(self, sleep=None):
+        # call once at the end of every iteration with the seconds the sampler
+        # sleeps before the next one, None if it waits for an event
+        now = self.clock()
+        late = None
+        period = None
+        if self.last_tick is not None:
+            period = now - self.last_tick
+            self.period.add(period)
+            if self.sleep is not None:
+                late = period - self.sleep
+        if sleep is None and self.sampled_at is not None:
+            # the next wait for an event starts this late
+            late = now - self.sampled_at
+        if late is not None:
+            self.lateness.add(max(late, 0.0))
+            if late > self.stall:
+                steps = sorted(self.steps.items(), key=lambda item: -item[1])
+                self.stalls.append({
+                    'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'period_ms': None if period is None else round(period * 1000, 1),
+                    'late_ms': round(late * 1000, 1),
+                    'steps_ms': {name: round(seconds * 1000, 1) for name, seconds in steps[:3]},
+                })
+        self.steps = {}
+        self.last_tick = now
+        self.sleep = sleep
+        self.sampled_at = None
+        if now > self.next_dump:
+            self.dump()
+            self.next_dump = now + self.dump_interval
+
+    def report(self):
+        return {
+            'written': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'running_s': round(time.time() - self.started, 1),
+            'intended_ms': None if self.intended is None else self.intended * 1000,
+            'stall_ms': self.stall * 1000,
+            'period': self.period.summary(),
+            'lateness': self.lateness.summary(),
+            'calls': {name: timer.summary() for name, timer in sorted(self.timers.items())},
+            'stalls': list(self.stalls),
+        }
+
+    def dump(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(self.report(), file, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print('loop stats not written:', e)
+
+
+def print_report(report):
+    print('loop stats of {}, running for {:.0f} s, intended period {} ms'.format(
+        report['written'], report['running_s'], _ms(report['intended_ms'])))
+    rows = [('loop period', report['period']), ('late', report['lateness'])]
+    rows += sorted(report['calls'].items())
+    print('{:<16}{:>9}{:>10}{:>10}{:>10}{:>10}{:>10}'.format('', 'count', 'mean ms', 'p50 ms', 'p99 ms', 'max ms', 'total s'))
+    for name, summary in rows:
+        print('{:<16}{:>9}{:>10}{:>10}{:>10}{:>10}{:>10}'.format(
+            name, summary['count'], _ms(summary['mean_ms']), _ms(summary.get('p50_ms')),
+            _ms(summary.get('p99_ms')), _ms(summary['max_ms']), summary['total_s']))
+    print('loop period histogram (ms):', ', '.join('{} {}'.format(label, n)
+                                                   for label, n in report['period']['histogram_ms'].items()))
+    print('{} stalls of more than {:g} ms'.format(len(report['stalls']), report['stall_ms']))
+    for stall in report['stalls'][-10:]:
+        steps = ', '.join('{} {} ms'.format(name, ms) for name, ms in stall['steps_ms'].items())
+        print('  {}  {:>8} ms late  ({})'.format(stall['at'], stall['late_ms'], steps))
+
+
+def _ms(value):
+    return '-' if value is None else '{:.2f}'.format(value)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join('data', 'loop_stats.json')
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            report = json.load(file)
+    except (OSError, ValueError) as e:
+        print('no loop stats in {} ({}), run "python script.py --loop-stats"'.format(path, e))
+        sys.exit(1)
+    print_report(report)
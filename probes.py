@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Platform probes: which window has the focus and how long the user is idle.
+
+WindowsProbe  win32gui for the window, pyautogui and msvcrt for the input
+X11Probe      _NET_ACTIVE_WINDOW and the XScreenSaver extension via ctypes
+ReplayProbe   plays back a recorded trace on a virtual clock, as fast as possible
+
+Every probe has window_name(), the cleaned title of the foreground window
+('' if there is none), and idle_seconds(), the seconds since the last user
+input. Probe adds the clock, now() and sleep().
+"""
+import sys
+import time
+import bisect
+import csv
+
+
+def clean_title(window_name):
+    # titles are stored lower case, without commas and in latin_1 in the logs
+    window_name = window_name.lower().replace(',', '')
+    return window_name.encode("latin_1", "ignore").decode("latin_1", "ignore")
+
+
+class Probe():
+    # live probes run on the wall clock, replayed ones on their own
+    live = True
+
+    def now(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class WindowsProbe(Probe):
+
+    def __init__(self):
+        import win32gui
+        import pyautogui
+        import msvcrt
+        self.win32gui = win32gui
+        self.pyautogui = pyautogui
+        self.msvcrt = msvcrt
+        self.last_time_key_pressed = time.time()
+        self.last_time_mouse_moved = time.time()
+        self.last_mouse_coords = [0, 0]
+
+    def window_name(self):
+        try:
+            parent = self.win32gui.GetForegroundWindow()
+            return clean_title(self.win32gui.GetWindowText(parent))
+        except self.win32gui.error as E:
+            print(E)
+
+    def idle_seconds(self):
+        try:
+            x, y = self.pyautogui.position()
+            if [x, y] != self.last_mouse_coords:
+                self.last_mouse_coords = [x, y]
+                self.last_time_mouse_moved = time.time()
+        except Exception:
+            pass
+        if self.msvcrt.kbhit():
+            self.last_time_key_pressed = time.time()
+        return time.time() - max(self.last_time_mouse_moved, self.last_time_key_pressed)
+
+
+class X11Probe(Probe):
+
+    XA_WINDOW = 33
+    SUCCESS = 0
+
+    def __init__(self, display=None):
+        import ctypes
+        import ctypes.util
+        self.ctypes = ctypes
+        c_ulong = ctypes.c_ulong
+        xlib_name = ctypes.util.find_library('X11')
+        xss_name = ctypes.util.find_library('Xss')
+        if not xlib_name or not xss_name:
+            raise OSError('libX11 and libXss are needed for the X11 probe')
+        self.xlib = ctypes.cdll.LoadLibrary(xlib_name)
+        self.xss = ctypes.cdll.LoadLibrary(xss_name)
+
+        class XScreenSaverInfo(ctypes.Structure):
+            _fields_ = [('window', c_ulong), ('state', ctypes.c_int), ('kind', ctypes.c_int),
+                        ('til_or_since', c_ulong), ('idle', c_ulong), ('eventMask', c_ulong)]
+
+        class XErrorEvent(ctypes.Structure):
+            _fields_ = [('type', ctypes.c_int), ('display', ctypes.c_void_p), ('resourceid', c_ulong),
+                        ('serial', c_ulong), ('error_code', ctypes.c_ubyte),
+                        ('request_code', ctypes.c_ubyte), ('minor_code', ctypes.c_ubyte)]
+
+        self.xlib.XOpenDisplay.restype = ctypes.c_void_p
+        self.xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        self.xlib.XDefaultRootWindow.restype = c_ulong
+        self.xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        self.xlib.XInternAtom.restype = c_ulong
+        self.xlib.XInternAtom.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
+        self.xlib.XGetWindowProperty.argtypes = [
+            ctypes.c_void_p, c_ulong, c_ulong, ctypes.c_long, ctypes.c_long, ctypes.c_int, c_ulong,
+            ctypes.POINTER(c_ulong), ctypes.POINTER(ctypes.c_int), ctypes.POINTER(c_ulong),
+            ctypes.POINTER(c_ulong), ctypes.POINTER(ctypes.c_void_p)]
+        self.xlib.XFree.argtypes = [ctypes.c_void_p]
+        self.xss.XScreenSaverAllocInfo.restype = ctypes.POINTER(XScreenSaverInfo)
+        self.xss.XScreenSaverQueryInfo.argtypes = [ctypes.c_void_p, c_ulong, ctypes.POINTER(XScreenSaverInfo)]
+
+        # the default handler exits the process, e.g. on BadWindow when the
+        # active window closes before its title is read. Errors are only
+        # recorded, _get_property then returns None.
+        self.x_error = None
+        handler_type = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(XErrorEvent))
+        self.xlib.XSetErrorHandler.restype = ctypes.c_void_p
+        self.xlib.XSetErrorHandler.argtypes = [handler_type]
+        # kept on self, Xlib calls it for as long as the process runs
+        self.error_handler = handler_type(self._on_error)
+        self.xlib.XSetErrorHandler(self.error_handler)
+
+        self.display = self.xlib.XOpenDisplay(display.encode() if display else None)
+        if not self.display:
+            raise OSError('cannot open X display')
+        self.root = self.xlib.XDefaultRootWindow(self.display)
+        self.atom_active = self.xlib.XInternAtom(self.display, b'_NET_ACTIVE_WINDOW', False)
+        self.atom_name = self.xlib.XInternAtom(self.display, b'_NET_WM_NAME', False)
+        self.atom_utf8 = self.xlib.XInternAtom(self.display, b'UTF8_STRING', False)
+        self.atom_wm_name = self.xlib.XInternAtom(self.display, b'WM_NAME', False)
+        self.info = self.xss.XScreenSaverAllocInfo()
+
+    def _on_error(self, display, event):
+        self.x_error = event.contents.error_code
+        return 0
+
+    def _get_property(self, window, prop, req_type):
+        # list of longs for format 32 properties, bytes otherwise, None if not set
+        ctypes = self.ctypes
+        actual_type = ctypes.c_ulong()
+        actual_format = ctypes.c_int()
+        n_items = ctypes.c_ulong()
+        bytes_after = ctypes.c_ulong()
+        data = ctypes.c_void_p()
+        self.x_error = None
+        status = self.xlib.XGetWindowProperty(
+            self.display, window, prop, 0, 1024, False, req_type,
+            ctypes.byref(actual_type), ctypes.byref(actual_format), ctypes.byref(n_items),
+            ctypes.byref(bytes_after), ctypes.byref(data))
+        if status != self.SUCCESS or self.x_error is not None or not data.value:
+            if data.value:
+                self.xlib.XFree(data)
+            return None
+        try:
+            if actual_format.value == 32:
+                # format 32 properties come as an array of C longs
+                values = ctypes.cast(data, ctypes.POINTER(ctypes.c_ulong))
+                return [values[idx] for idx in range(n_items.value)]
+            return ctypes.string_at(data, n_items.value)
+        finally:
+            self.xlib.XFree(data)
+
+    def window_name(self):
+        active = self._get_property(self.root, self.atom_active, self.XA_WINDOW)
+        if not active or not active[0]:
+            return ''
+        name = self._get_property(active[0], self.atom_name, self.atom_utf8)
+        if name is None:
+            name = self._get_property(active[0], self.atom_wm_name, 0)
+        if not name:
+            return ''
+        return clean_title(name.decode('utf-8', 'ignore'))
+
+    def idle_seconds(self):
+        self.xss.XScreenSaverQueryInfo(self.display, self.root, self.info)
+        return self.info.contents.idle / 1000.0
+
+
+class ReplayProbe(Probe):
+    # trace: list of (time, window, idle) at every change, sorted by time.
+    # sleep() only moves the virtual clock, the replay ends with StopIteration
+    # once the clock passes the last entry of the trace.
+    live = False
+
+    def __init__(self, trace, idle_time=3*60):
+        self.trace = trace
+        self.times = [entry[0] for entry in trace]
+        self.idle_time = idle_time
+        self.clock = trace[0][0] if trace else 0.0
+        self.end = trace[-1][0] if trace else 0.0
+
+    @classmethod
+    def from_log(cls, path, idle_time=3*60):
+        # rebuild a trace from a day log, every row is an event of 'duration'
+        # seconds ending at 'time'
+        trace = []
+        last_end = 0.0
+        with open(path, 'r', encoding='utf-8', errors='ignore') as file:
+            for words in csv.reader(file):
+                if len(words) < 4:
+                    continue
+                try:
+                    end = float(words[0])
+                    duration = float(words[2])
+                except ValueError:
+                    continue
+                trace.append((end - duration, words[3], words[1] == 'idle'))
+                last_end = max(last_end, end)
+        trace.sort(key=lambda entry: entry[0])
+        if trace:
+            # switch away at the end so the last event gets recorded too
+            trace.append((last_end, 'end of replay', False))
+        return cls(trace, idle_time)
+
+    def _current(self):
+        if not self.trace:
+            # nothing to replay
+            raise StopIteration
+        return self.trace[max(0, bisect.bisect_right(self.times, self.clock) - 1)]
+
+    def window_name(self):
+        return self._current()[1]
+
+    def idle_seconds(self):
+        # idle entries of the trace count as idle for longer than the limit
+        if self._current()[2]:
+            return self.idle_time + 1
+        return 0.0
+
+    def now(self):
+        return self.clock
+
+    def sleep(self, seconds):
+        if self.clock >= self.end:
+            raise StopIteration
+        # jump straight to the next change, nothing happens in between
+        idx = bisect.bisect_right(self.times, self.clock)
+        if idx < len(self.times):
+            self.clock = self.times[idx]
+        else:
+            self.clock = self.end
+
+
+def make_probe(kind='auto'):
+    if kind == 'auto':
+        kind = 'windows' if sys.platform == 'win32' else 'x11'
+    if kind == 'windows':
+        return WindowsProbe()
+    if kind == 'x11':
+        return X11Probe()
+    raise ValueError('unknown probe ' + kind)
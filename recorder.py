@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+State machine of the recorder, independent of where the samples come from.
+
+Feed it samples (time, window title, idle flag) and it returns an Event
+whenever the previous window or idle period ended and is worth recording.
+"""
+from collections import namedtuple
+
+# time: end of the event, start: begin of the event, label: window or 'idle'
+Event = namedtuple('Event', ['time', 'start', 'duration', 'category', 'window', 'label'])
+
+
+class Recorder():
+
+    def __init__(self, get_cat, now=0.0):
+        self.get_cat = get_cat
+        self.start_of_event = now
+        self.last_window = 'start tracking'
+        self.last_event = ''
+
+    def feed(self, sample):
+        if sample.idle:
+            current_event = 'idle'
+        else:
+            current_event = sample.window
+
+        if current_event == self.last_event:
+            return None
+
+        if self.last_event == 'idle':
+            category = 'idle'
+        else:
+            category = self.get_cat(self.last_window)
+
+        duration = sample.time - self.start_of_event
+        record = False
+        if duration < 18 and category == 'idle':
+            record = True
+        if duration > 2 and category != 'idle':
+            record = True
+        event = None
+        if record:
+            event = Event(sample.time, self.start_of_event, duration, category,
+                          self.last_window, self.last_event)
+
+        self.last_window = sample.window
+        self.start_of_event = sample.time
+        self.last_event = current_event
+        return event
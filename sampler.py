@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Samplers decide when the recorder looks at the foreground window and the
+user input again.
+
+PollingSampler   asks the probes in a loop and backs off while nothing changes
+WinEventSampler  sleeps until Windows reports a foreground or title change
+ScriptedSampler  replays a list of samples without sleeping, for tests and
+                 benchmarks on any platform
+
+Every sampler has next(), which returns the next Sample and raises
+StopIteration when there are no more, Sampler turns it into an iterator.
+"""
+import sys
+import time
+from collections import namedtuple
+
+Sample = namedtuple('Sample', ['time', 'window', 'idle'])
+
+
+class Sampler():
+
+    def __init__(self):
+        self.wakeups = 0
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.next()
+            except StopIteration:
+                return
+
+
+class PollingSampler(Sampler):
+
+    def __init__(self, get_window, is_idle, min_interval=0.01, max_interval=0.5,
+                 backoff=1.5, clock=time.time, sleep=time.sleep):
+        super().__init__()
+        self.get_window = get_window
+        self.is_idle = is_idle
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.clock = clock
+        self.sleep = sleep
+        self.interval = min_interval
+        self.last = None
+
+    def next(self):
+        if self.last is not None:
+            self.sleep(self.interval)
+        self.wakeups += 1
+        sample = Sample(self.clock(), self.get_window(), self.is_idle())
+        if self.last is not None and sample[1:] == self.last[1:]:
+            # nothing happened, look again a bit later
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        else:
+            self.interval = self.min_interval
+        self.last = sample
+        return sample
+
+
+class WinEventSampler(Sampler):
+    # wakes up on EVENT_SYSTEM_FOREGROUND and on title changes of the foreground
+    # window. Idle is taken from GetLastInputInfo, while the user is active the
+    # sampler sleeps until the idle limit could be reached, while idle it checks
+    # every idle_check seconds for the user coming back.
+
+    EVENT_SYSTEM_FOREGROUND = 0x0003
+    EVENT_OBJECT_NAMECHANGE = 0x800C
+    WINEVENT_OUTOFCONTEXT = 0x0000
+    OBJID_WINDOW = 0
+    QS_ALLINPUT = 0x04FF
+    PM_REMOVE = 0x0001
+
+    def __init__(self, get_window, idle_time, max_wait=1.0, idle_check=0.5):
+        super().__init__()
+        import ctypes
+        from ctypes import wintypes
+        self.ctypes = ctypes
+        self.user32 = ctypes.windll.user32
+        self.kernel32 = ctypes.windll.kernel32
+        self.get_window = get_window
+        self.idle_time = idle_time
+        self.max_wait = max_wait
+        self.idle_check = idle_check
+        self.changed = True
+        self.msg = wintypes.MSG()
+
+        class LASTINPUTINFO(ctypes.Structure):
+            _fields_ = [('cbSize', wintypes.UINT), ('dwTime', wintypes.DWORD)]
+        self.last_input = LASTINPUTINFO()
+        self.last_input.cbSize = ctypes.sizeof(LASTINPUTINFO)
+
+        proc_type = ctypes.WINFUNCTYPE(None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+                                       wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+        self.user32.SetWinEventHook.restype = wintypes.HANDLE
+        self.user32.GetForegroundWindow.restype = wintypes.HWND
+        # keep a reference, the hook must not be garbage collected
+        self.proc = proc_type(self._on_event)
+        self.hooks = [
+            self.user32.SetWinEventHook(self.EVENT_SYSTEM_FOREGROUND, self.EVENT_SYSTEM_FOREGROUND,
+                                        0, self.proc, 0, 0, self.WINEVENT_OUTOFCONTEXT),
+            self.user32.SetWinEventHook(self.EVENT_OBJECT_NAMECHANGE, self.EVENT_OBJECT_NAMECHANGE,
+                                        0, self.proc, 0, 0, self.WINEVENT_OUTOFCONTEXT),
+        ]
+
+    def _on_event(self, hook, event, hwnd, id_object, id_child, thread, event_time):
+        if event == self.EVENT_SYSTEM_FOREGROUND:
+            self.changed = True
+        elif id_object == self.OBJID_WINDOW and hwnd == self.user32.GetForegroundWindow():
+            self.changed = True
+
+    def idle_seconds(self):
+        self.user32.GetLastInputInfo(self.ctypes.byref(self.last_input))
+        return ((self.kernel32.GetTickCount() - self.last_input.dwTime) & 0xFFFFFFFF) / 1000.0
+
+    def _wait(self, timeout):
+        self.user32.MsgWaitForMultipleObjects(0, None, False, int(timeout * 1000), self.QS_ALLINPUT)
+        # dispatching the messages runs _on_event for the queued win events
+        while self.user32.PeekMessageW(self.ctypes.byref(self.msg), None, 0, 0, self.PM_REMOVE):
+            self.user32.TranslateMessage(self.ctypes.byref(self.msg))
+            self.user32.DispatchMessageW(self.ctypes.byref(self.msg))
+
+    def next(self):
+        if not self.changed:
+            if self.idle_seconds() > self.idle_time:
+                timeout = self.idle_check
+            else:
+                timeout = self.idle_time - self.idle_seconds() + 0.05
+            # come back at least every max_wait so the caller can do its periodic work
+            self._wait(max(0.0, min(timeout, self.max_wait)))
+        self.changed = False
+        self.wakeups += 1
+        return Sample(time.time(), self.get_window(), self.idle_seconds() > self.idle_time)
+
+    def close(self):
+        for hook in self.hooks:
+            self.user32.UnhookWinEvent(hook)
+        self.hooks = []
+
+
+class ScriptedSampler(Sampler):
+
+    def __init__(self, samples):
+        super().__init__()
+        self.samples = iter(samples)
+
+    def next(self):
+        sample = next(self.samples)
+        self.wakeups += 1
+        return Sample(*sample)
+
+
+def make_sampler(kind, probe, idle_time):
+    # 'event' falls back to polling where the win event hooks are not available
+    if kind == 'event' and sys.platform == 'win32' and probe.live:
+        try:
+            return WinEventSampler(probe.window_name, idle_time)
+        except (ImportError, AttributeError, OSError) as e:
+            print('event sampler not available, polling instead:', e)
+    return PollingSampler(probe.window_name, lambda: probe.idle_seconds() > idle_time,
+                          clock=probe.now, sleep=probe.sleep)
@@ -13,163 +13,293 @@ install win32 gui from:
     Step 4: python
 """
 import os
+import io
 import sys
-import win32gui
 import time
 import datetime
-import pyautogui
-import msvcrt
 import configparser
 import numpy as np
-import csv
+import queue
+import threading
 from analytics import Analytics
+import binlog
+from event_writer import EventWriter
+from recorder import Recorder
+from sampler import make_sampler
+from probes import make_probe, ReplayProbe
+from live_aggregate import DayAggregate
+from loop_stats import LoopStats, print_report
+from live_server import LiveServer
 from broser_start import generate_inspirational_html
 
-last_time_key_pressed = time.time()
-last_time_mouse_moved = time.time()
-last_mouse_coords = [0, 0]
-start_of_event = time.time()
-last_window = 'start tracking'
-last_event = ''
 idle_time = 3*60 # 3 minutes.
 html_update_time = time.time() + 60
+config_check_interval = 2 # seconds between two looks at config.dat
+checkpoint_interval = 5 # seconds between two checkpoints of today's totals
+event_writer = None
+live = None
+loop_stats = None
 
-def main():
-    global start_of_event
-    global last_window
-    global last_event
+def main(probe=None, folder='data', verbose=True, stats=False, port=None):
     global html_update_time
+    global event_writer
+    global live
+    global loop_stats
     np.seterr(all='ignore')
 
     analytic = Analytics()
+    if probe is None:
+        # 'auto' picks the windows or the x11 probe for this platform
+        probe = make_probe(analytic.config.get('SETTINGS', 'probe', fallback='auto'))
+    # at most this many seconds of recorded events are lost if the script dies
+    max_unsaved = analytic.config.getfloat('SETTINGS', 'max_unsaved_seconds', fallback=30)
+    event_writer = EventWriter(folder, max_delay=max_unsaved, clock=probe.now)
+    live = restore_live(analytic, folder, probe.now())
+    checkpointed_rows = 0
+    checkpoint_time = 0
     html_counter = 0;
-    print("""
+    loop_stats = None
+    step = lambda name, func: func
+    if stats or analytic.config.getboolean('SETTINGS', 'loop_stats', fallback=False):
+        # time every step of the loop, see loop_stats.py
+        loop_stats = LoopStats(os.path.join(folder, 'loop_stats.json'),
+                               analytic.config.getfloat('SETTINGS', 'loop_stats_interval', fallback=60))
+        step = loop_stats.wrap
+        probe.window_name = step('window_name', probe.window_name)
+        probe.idle_seconds = step('idle', probe.idle_seconds)
+    refresher = None
+    server = None
+    if probe.live:
+        refresher = RefreshWorker(live, loop_stats)
+        refresher.start()
+        if port is None:
+            port = analytic.config.getint('SETTINGS', 'server_port', fallback=0)
+        if port:
+            # pushes every event to the open dashboards, see live_server.py
+            try:
+                server = LiveServer(live, port)
+                server.start()
+                print('live dashboard on', server.url())
+            except OSError as e:
+                print('live dashboard not started:', e)
+    # 'event' waits for window changes, 'polling' checks the window in a loop
+    sampler_kind = analytic.config.get('SETTINGS', 'sampler', fallback='event')
+    sampler = make_sampler(sampler_kind, probe, idle_time)
+    if loop_stats is not None:
+        if hasattr(sampler, 'idle_seconds'):
+            # the event sampler asks windows for the idle time itself
+            sampler.idle_seconds = step('idle', sampler.idle_seconds)
+        # None for the event sampler, it has no fixed period
+        loop_stats.intended = getattr(sampler, 'min_interval', None)
+    recorder = Recorder(analytic.get_cat, probe.now())
+    feed = step('classify', recorder.feed)
+    save = step('save_data', save_data)
+    add_live = step('live_add', live.add)
+    poll = step('flush', event_writer.poll)
+    checkpoint = step('checkpoint', checkpoint_live)
+    reload_config = step('reload_config', analytic.reload_config)
+    publish = step('publish', server.publish) if server is not None else None
+    if verbose:
+        print("""
 ---------------------------------------
 TRACK YOUR TIME - DON'T WASTE IT!
 ---------------------------------------
 
   TIME           CATEGORY""")
 
-    while True:
-        mouse_idle = is_mouse_idle()
-        keyboard_idle = is_keyboard_idle(0.01)
-
-        current_window = get_window_name()
-        idle = mouse_idle and keyboard_idle
-
-        if idle:
-            current_event = 'idle'
-        else:
-            current_event = current_window
-
-
-        if current_event != last_event:
-            if last_event == 'idle':
-                category = 'idle'
-            else:
-                category = analytic.get_cat(last_window)
-
-            duration = time.time() - start_of_event
-            bRecord = False
-            if duration < 18 and category == 'idle':
-                bRecord = True
-            if duration > 2 and category != 'idle':
-                bRecord = True
-            if bRecord == True:
-                save_data([time.time(), category, int(duration), last_window])
-                try:
-                    if sys.version_info.major >2:
-                        mins = int(np.floor(duration/60))
-                        secs = int(np.floor(duration - mins*60))
-                        local_t = time.localtime(start_of_event)
-                        print("{0:02}:{1:02} -{2: 3}:{3:02} min\t".format(local_t.tm_hour,local_t.tm_min, mins, secs),
-                              "{}	".format(category),
-                              "({})".format(last_event[:120]))
-                except UnicodeDecodeError:
-                    print("{0: 5.0f} s\t".format(duration), "UNICODE DECODE ERROR")
-
-            last_window = current_window
-            start_of_event = time.time()
-            last_event = current_event
-
-        if time.time() > html_update_time:
+    events = 0
+    config_check_time = time.time() + config_check_interval
+    for sample in sampler:
+        if loop_stats is not None:
+            loop_stats.sampled()
+        if time.time() > config_check_time:
+            # new rules apply to the next event without a restart
+            if reload_config():
+                print('config.dat reloaded')
+            config_check_time = time.time() + config_check_interval
+
+        event = feed(sample)
+        if event is not None:
+            events += 1
+            row = [event.time, event.category, int(event.duration), event.window]
+            project = analytic.get_project(event.window) if event.category != 'idle' else ''
+            if project:
+                # the project goes after the hh:mm column that redo_cat adds
+                local_t = time.localtime(event.time)
+                row += ['{0:02}:{1:02}'.format(local_t.tm_hour, local_t.tm_min), project]
+            save(row)
+            add_live(event.time, event.category, int(event.duration), event.window, project)
+            if publish is not None:
+                publish(event.time, event.category, int(event.duration), project)
+            try:
+                if verbose and sys.version_info.major >2:
+                    mins = int(np.floor(event.duration/60))
+                    secs = int(np.floor(event.duration - mins*60))
+                    local_t = time.localtime(event.start)
+                    print("{0:02}:{1:02} -{2: 3}:{3:02} min\t".format(local_t.tm_hour,local_t.tm_min, mins, secs),
+                          "{}	".format(event.category),
+                          "({})".format(event.label[:120]))
+            except UnicodeDecodeError:
+                print("{0: 5.0f} s\t".format(event.duration), "UNICODE DECODE ERROR")
+
+        poll()
+        if event_writer.rows_written != checkpointed_rows and time.time() > checkpoint_time:
+            # checkpoint after the day log got new rows, so both stay close
+            checkpoint()
+            checkpointed_rows = event_writer.rows_written
+            checkpoint_time = time.time() + checkpoint_interval
+
+        if refresher is not None and time.time() > html_update_time:
             html_counter = html_counter +1
-            analytic.create_html()
+            refresher.request(inspirational=html_counter %  5  == 1)
             html_update_time = time.time()+ 120
-            if html_counter %  5  == 1 :
-                image_folder = analytic.config.get('SETTINGS', 'image_folder', fallback='figs/pictures')
-                md_folder = analytic.config.get('SETTINGS', 'md_folder', fallback='C:/Users/YourUser/Documents/Notes')
-                result = generate_inspirational_html(image_folder, md_folder)
+        if loop_stats is not None:
+            # the polling sampler sleeps 'interval' before the next sample,
+            # the event sampler has none and waits for the next event
+            loop_stats.tick(getattr(sampler, 'interval', None))
+    if server is not None:
+        server.stop()
+    checkpoint_live()
+    event_writer.close()
+    if loop_stats is not None:
+        loop_stats.dump()
+    return events
 
-def save_data(data):
-    today = datetime.datetime.now()
-    folder = 'data/'
-    filename = '{0:d}-{1:02d}-{2:02d}.csv'.format(today.year, today.month, today.day)
-    #filename = str(today.year) + '-' + str(today.month) + '-' + str(today.day) + '.csv'
-    path = folder + filename
-    if not os.path.isdir(folder):
-        os.mkdir(folder)
-    with open(path, 'a') as file:
-        writer = csv.writer(file, delimiter=',', lineterminator="\r")
-        writer.writerow(data)
-
-
-def is_mouse_idle():
-    global last_time_mouse_moved
-    global last_mouse_coords
-    global idle_time
 
-    try:
-        x, y = pyautogui.position()
-        mouse_coords = [x,y]
-    except:
-        pass
+def checkpoint_live():
+    # the buffered rows are written first, the checkpoint then covers the
+    # day log up to its current end
+    event_writer.flush()
+    live.checkpoint(os.path.join(event_writer.folder, 'live.json'), event_writer.path(live.day))
 
-    if mouse_coords != last_mouse_coords:
-        last_mouse_coords = [x, y]
-        last_time_mouse_moved = time.time()
-    elif time.time() > last_time_mouse_moved + idle_time:
-        return True
 
-    return False
+def restore_live(analytic, folder, now):
+    # today's running totals from the last checkpoint and the rows written to
+    # the day log after it, or from the day log alone when the checkpoint does
+    # not match the log
+    day = datetime.date.fromtimestamp(now)
+    live = DayAggregate.restore(os.path.join(folder, 'live.json'), day)
+    path = os.path.join(folder, live.logfile())
+    if not os.path.isfile(path):
+        return live
+    if live.events and live.log is not None:
+        size, end = live.log[0], live.log[1].encode('latin-1')
+        with open(path, 'rb') as file:
+            file.seek(size - len(end))
+            if size <= os.path.getsize(path) and file.read(len(end)) == end:
+                tail = file.read()
+                if tail:
+                    live.add_frame(binlog.read_csv(io.BytesIO(tail)))
+                return live
+    live = DayAggregate(day)
+    live.add_frame(analytic._read_log(path))
+    return live
 
 
-def get_window_name():
-    try:
-        parent = win32gui.GetForegroundWindow()
-        window_name = win32gui.GetWindowText(parent).lower()
-        window_name = window_name.replace(',', '')
-        window_name = window_name.lower().encode("latin_1", "ignore")
-        window_name = window_name.lower().decode("latin_1", "ignore")
+def replay(trace_paths, folder='replay', stats=False):
+    # run the recorder and the classification on recorded day logs, as fast as
+    # possible, the events are written to 'folder' instead of 'data'
+    events = 0
+    start = time.perf_counter()
+    for path in trace_paths:
+        probe = ReplayProbe.from_log(path, idle_time)
+        if not probe.trace:
+            print('no events in', path)
+            continue
+        events += main(probe, folder, verbose=False, stats=stats)
+    elapsed = time.perf_counter() - start
+    print('replayed {} events in {:.2f} s, {:.0f} events/s'.format(events, elapsed, events / max(elapsed, 1e-9)))
+    return events, elapsed
 
-        return window_name
-    except win32gui.error as E:
-        print(E)
 
+class RefreshWorker(threading.Thread):
+    # rebuilds the html pages in the background so the polling loop never waits
+    # for matplotlib or the log files. At most one refresh is queued, requests
+    # arriving while one is still pending are merged into it and counted.
 
-def is_keyboard_idle(sleep_duration):
-    global last_time_key_pressed
-    global idle_time
+    def __init__(self, live=None, stats=None):
+        super().__init__(name='html refresh', daemon=True)
+        self.live = live
+        self.stats = stats
+        self.requests = queue.Queue(maxsize=1)
+        self.lock = threading.Lock()
+        self.refreshes = 0
+        self.skipped = 0
+        self.reported_skips = 0
 
-    time.sleep(sleep_duration)
-    key_pressed = msvcrt.kbhit()
+    def request(self, inspirational=False):
+        with self.lock:
+            try:
+                self.requests.put_nowait(inspirational)
+                return
+            except queue.Full:
+                self.skipped += 1
+            # the pending refresh also builds the inspirational page if either
+            # request asked for it, the worker may have taken it meanwhile
+            try:
+                inspirational = self.requests.get_nowait() or inspirational
+            except queue.Empty:
+                pass
+            self.requests.put_nowait(inspirational)
 
-    if key_pressed:
-        #keys = msvcrt.getch() # reads the keys and resets kbhit()
-        last_time_key_pressed = time.time()
+    def run(self):
+        analytic = Analytics()
+        analytic.live = self.live
+        while True:
+            inspirational = self.requests.get()
+            start = time.perf_counter()
+            try:
+                analytic.reload_config()
+                analytic.create_html()
+                if inspirational:
+                    image_folder = analytic.config.get('SETTINGS', 'image_folder', fallback='figs/pictures')
+                    md_folder = analytic.config.get('SETTINGS', 'md_folder', fallback='C:/Users/YourUser/Documents/Notes')
+                    generate_inspirational_html(image_folder, md_folder)
+            except (Exception, SystemExit) as e:
+                # generate_inspirational_html calls exit() when nothing is found
+                print('html refresh failed:', e)
+            if self.stats is not None:
+                # runs beside the loop, so it is not a step of an iteration
+                self.stats.add('html_refresh', time.perf_counter() - start, step=False)
+            self.refreshes += 1
+            if self.skipped != self.reported_skips:
+                print('html refresh: {} requests merged so far, refresh is slower than the update interval'.format(self.skipped))
+                self.reported_skips = self.skipped
 
-    if time.time() > last_time_key_pressed + idle_time:
-        return True
-    return False
+def save_data(data):
+    event_writer.write(data)
 
 
 if __name__ == '__main__':
+    args = sys.argv[1:]
+    stats = '--loop-stats' in args
+    if stats:
+        args.remove('--loop-stats')
+    port = None
+    if '--serve' in args:
+        # '--serve' alone uses port 8765
+        idx = args.index('--serve')
+        port = int(args.pop(idx + 1)) if idx + 1 < len(args) and args[idx + 1].isdigit() else 8765
+        args.pop(idx)
+    if len(args) > 1 and args[0] == '--replay':
+        replay(args[1:], stats=stats)
+        if loop_stats is not None:
+            print_report(loop_stats.report())
+        sys.exit()
     try:
-        main()
+        main(stats=stats, port=port)
     except KeyboardInterrupt:
         print('Process interrupted.')
     except Exception as e:
         print (e)
     finally:
+        if event_writer is not None:
+            if live is not None:
+                # also on Ctrl-C, the next start then only reads the rows after it
+                checkpoint_live()
+            event_writer.close()
+        if loop_stats is not None:
+            loop_stats.dump()
+            print_report(loop_stats.report())
         print('Press ENTER to quit ...')
         input()
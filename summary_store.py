@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent per-day summary of the logs in 'data'.
+
+Stores the seconds per category, per project and per window title of every
+day file together with the size and mtime the numbers were computed from, so only new
+or changed day files have to be parsed again.
+"""
+import os
+import sqlite3
+from contextlib import closing
+
+
+class SummaryStore():
+
+    def __init__(self, path='data/summary.sqlite'):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.mkdir(folder)
+        with closing(self._connect()) as con, con:
+            tables = set(name for name, in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'"))
+            con.execute('CREATE TABLE IF NOT EXISTS files '
+                        '(logfile TEXT PRIMARY KEY, size INTEGER, mtime INTEGER)')
+            con.execute('CREATE TABLE IF NOT EXISTS totals '
+                        '(logfile TEXT, category TEXT, duration REAL, '
+                        'PRIMARY KEY (logfile, category))')
+            con.execute('CREATE TABLE IF NOT EXISTS classified '
+                        '(logfile TEXT PRIMARY KEY, version TEXT, size INTEGER, mtime INTEGER)')
+            con.execute('CREATE TABLE IF NOT EXISTS titles '
+                        '(logfile TEXT, title TEXT, app TEXT, category TEXT, duration REAL, '
+                        'PRIMARY KEY (logfile, title, category))')
+            # covers the top title queries and the prefix search
+            con.execute('CREATE INDEX IF NOT EXISTS titles_title ON titles (title, category, duration)')
+            con.execute('CREATE TABLE IF NOT EXISTS projects '
+                        '(logfile TEXT, project TEXT, duration REAL, '
+                        'PRIMARY KEY (logfile, project))')
+            if tables and not {'titles', 'projects'} <= tables:
+                # store from before the title index or the projects, summarize
+                # every log again
+                con.execute('DELETE FROM files')
+
+    def _connect(self):
+        # short lived connections, the store is used from more than one thread
+        return sqlite3.connect(self.path, timeout=10)
+
+    def load(self):
+        # {logfile: (size, mtime, {category: seconds})}
+        summary = {}
+        with closing(self._connect()) as con, con:
+            for logfile, size, mtime in con.execute('SELECT logfile, size, mtime FROM files'):
+                summary[logfile] = (size, mtime, {})
+            for logfile, category, duration in con.execute('SELECT logfile, category, duration FROM totals'):
+                if logfile in summary:
+                    summary[logfile][2][category] = duration
+        return summary
+
+    def load_projects(self):
+        # {logfile: {project: seconds}}
+        projects = {}
+        with closing(self._connect()) as con, con:
+            for logfile, project, duration in con.execute('SELECT logfile, project, duration FROM projects'):
+                projects.setdefault(logfile, {})[project] = duration
+        return projects
+
+    def update(self, entries):
+        # entries: list of (logfile, size, mtime, {category: seconds},
+        # [(title, app, category, seconds)], {project: seconds})
+        if not entries:
+            return
+        with closing(self._connect()) as con, con:
+            for logfile, size, mtime, durations, titles, projects in entries:
+                con.execute('DELETE FROM totals WHERE logfile = ?', (logfile,))
+                con.execute('DELETE FROM titles WHERE logfile = ?', (logfile,))
+                con.execute('DELETE FROM projects WHERE logfile = ?', (logfile,))
+                con.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (logfile, size, mtime))
+                con.executemany('INSERT INTO totals VALUES (?, ?, ?)',
+                                [(logfile, cat, float(dur)) for cat, dur in durations.items()])
+                con.executemany('INSERT INTO titles VALUES (?, ?, ?, ?, ?)',
+                                [(logfile, title, app, cat, float(dur)) for title, app, cat, dur in titles])
+                con.executemany('INSERT INTO projects VALUES (?, ?, ?)',
+                                [(logfile, project, float(dur)) for project, dur in projects.items()])
+
+    def title_totals(self, by='title', start=None, end=None, prefix=None, exclude=(), limit=None,
+                     skip_logfile=None):
+        # [(title or app, seconds)] most time first, for the days from start to
+        # end ('2018-08-15', inclusive). exclude: categories to leave out
+        if by not in ('title', 'app'):
+            raise ValueError('title_totals by title or app, not ' + by)
+        where = []
+        args = []
+        if start is not None:
+            where.append('logfile >= ?')
+            args.append(start)
+        if end is not None:
+            where.append('logfile <= ?')
+            args.append(end + '.csv')
+        if prefix:
+            # a range instead of LIKE, so the index on the column is used
+            where.append('{0} >= ? AND {0} < ?'.format(by))
+            args += [prefix, prefix + '\uffff']
+        if skip_logfile is not None:
+            where.append('logfile != ?')
+            args.append(skip_logfile)
+        if exclude:
+            where.append('category NOT IN ({})'.format(', '.join('?' * len(exclude))))
+            args += list(exclude)
+        sql = 'SELECT {0}, SUM(duration) AS seconds FROM titles'.format(by)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' GROUP BY {} ORDER BY seconds DESC'.format(by)
+        if limit is not None:
+            sql += ' LIMIT ?'
+            args.append(limit)
+        with closing(self._connect()) as con, con:
+            return con.execute(sql, args).fetchall()
+
+    def classified(self, logfile):
+        # (config version, size, mtime) of the last redo_cat of this log or None
+        with closing(self._connect()) as con, con:
+            row = con.execute('SELECT version, size, mtime FROM classified WHERE logfile = ?',
+                              (logfile,)).fetchone()
+        if row is None:
+            return None
+        return tuple(row)
+
+    def set_classified(self, logfile, version, size, mtime):
+        with closing(self._connect()) as con, con:
+            con.execute('INSERT OR REPLACE INTO classified VALUES (?, ?, ?, ?)', (logfile, version, size, mtime))
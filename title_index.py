@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Window titles and application names for the drill-down index.
+
+Titles are normalized so the same window adds up to one entry even when an
+unread counter or an unsaved marker changes, the application is the last
+' - ' separated part of the title, where most programs put their name.
+The seconds per title and day are kept in the summary store next to the
+category totals.
+"""
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+_spaces = re.compile(r'\s+')
+# '(3) whatsapp', '* notes.txt - editor', 'notes.txt* - editor'
+_markers = re.compile(r'^\(\d+\)\s*|^\*\s*|\*(?= - |$)')
+
+
+@lru_cache(maxsize=65536)
+def normalize_title(title):
+    if not isinstance(title, str):
+        return ''
+    title = _spaces.sub(' ', title.lower()).strip()
+    return _markers.sub('', title).strip()
+
+
+def app_name(title):
+    return title.rsplit(' - ', 1)[-1].strip()
+
+
+def aggregate_titles(df):
+    # [(title, application, category, seconds)] of a day log, idle time is
+    # not counted for the window that was open meanwhile
+    duration = pd.to_numeric(df.duration, errors='coerce').fillna(0).values
+    # every distinct title is normalized once, then the seconds are summed
+    # per (title, category) pair with one bincount
+    codes, uniques = pd.factorize(df.title)
+    title_codes, titles = pd.factorize(np.array([normalize_title(title) for title in uniques], dtype=object))
+    cat_codes, categories = pd.factorize(df.category)
+    valid = (codes >= 0) & (cat_codes >= 0)
+    pairs = title_codes[codes[valid]] * len(categories) + cat_codes[valid]
+    seconds = np.bincount(pairs, weights=duration[valid], minlength=len(titles) * len(categories))
+    pairs = np.flatnonzero(seconds)
+    titles = np.asarray(titles, dtype=object)[pairs // len(categories)]
+    categories = np.asarray(categories, dtype=object)[pairs % len(categories)]
+    return [(title, app_name(title), category, float(dur))
+            for title, category, dur in zip(titles, categories, seconds[pairs])
+            if title != '' and category != 'idle']